@@ -0,0 +1,215 @@
+import logging
+import threading
+from typing import Optional, Tuple
+
+import speech_recognition as sr
+
+# Seconds of audio AudioCapture keeps buffered by default
+DEFAULT_BUFFER_SECONDS = 30.0
+
+class AudioRingBuffer:
+    """
+    Fixed-size byte ring buffer for raw audio with independent reader cursors.
+
+    The storage is allocated once; writes copy each frame into it through a
+    memoryview. Readers keep their own absolute cursor, so several consumers
+    can read the same stream and nothing is lost between reads unless a reader
+    falls more than a full buffer behind the writer.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Buffer size in bytes
+        """
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._written = 0  # Total bytes ever written
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def write_position(self) -> int:
+        """Absolute position of the next byte to be written."""
+        with self._cond:
+            return self._written
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def write(self, data: bytes):
+        """Append data, overwriting the oldest audio once the buffer is full."""
+        src = memoryview(data)
+        if len(src) > self.capacity:
+            skipped = len(src) - self.capacity
+            src = src[skipped:]
+        else:
+            skipped = 0
+
+        with self._cond:
+            self._written += skipped
+            pos = self._written % self.capacity
+            first = min(len(src), self.capacity - pos)
+            self._view[pos:pos + first] = src[:first]
+            if first < len(src):
+                self._view[:len(src) - first] = src[first:]
+            self._written += len(src)
+            self._cond.notify_all()
+
+    def read(self, cursor: int, size: int, timeout: Optional[float] = None) -> Tuple[bytes, int]:
+        """
+        Read up to size bytes starting at an absolute cursor.
+
+        Blocks until size bytes are available, the buffer is closed or the
+        timeout expires. If the cursor has been overwritten, reading resumes
+        at the oldest audio still buffered.
+
+        Returns:
+            tuple: (data, new_cursor); data is empty once the buffer is closed and drained
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._written - cursor >= size or self._closed, timeout)
+
+            oldest = self._written - self.capacity
+            if cursor < oldest:
+                logging.warning(f"Audio reader fell behind; dropped {oldest - cursor} bytes")
+                cursor = oldest
+
+            n = min(size, self._written - cursor)
+            pos = cursor % self.capacity
+            first = min(n, self.capacity - pos)
+            data = bytes(self._view[pos:pos + first])
+            if first < n:
+                data += bytes(self._view[:n - first])
+            return data, cursor + n
+
+    def close(self):
+        """Mark the end of the stream and wake any waiting readers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class _ReaderStream:
+    """File-like stream over a ring buffer, as expected by speech_recognition."""
+
+    def __init__(self, ring: AudioRingBuffer, cursor: int, sample_width: int):
+        self.ring = ring
+        self.cursor = cursor
+        self.sample_width = sample_width
+
+    def read(self, size: int) -> bytes:
+        """
+        Read up to size frames.
+
+        Raises:
+            OSError: Once capture has stopped and every buffered frame was read;
+                an empty read would look like silence to the recognizer
+        """
+        # Like PyAudio and AudioFile streams, size is in frames, not bytes
+        data, self.cursor = self.ring.read(self.cursor, size * self.sample_width)
+        if not data and self.ring.closed:
+            raise OSError("Audio capture has stopped")
+        return data
+
+    def close(self):
+        pass
+
+class BufferedAudioSource(sr.AudioSource):
+    """
+    Audio source that reads from a shared capture ring buffer.
+
+    Can be passed to Recognizer.listen() and adjust_for_ambient_noise() like a
+    Microphone, but never opens a device; consecutive listens continue exactly
+    where the previous one stopped.
+    """
+
+    def __init__(self, ring: AudioRingBuffer, sample_rate: int, sample_width: int, chunk: int,
+                 cursor: Optional[int] = None):
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = sample_width
+        self.CHUNK = chunk
+        self.stream = _ReaderStream(ring, ring.write_position if cursor is None else cursor, sample_width)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def skip_to_live(self):
+        """Discard buffered audio this reader has not consumed yet."""
+        self.stream.cursor = self.stream.ring.write_position
+
+class AudioCapture:
+    """
+    Streams frames from an audio device into a ring buffer on a dedicated thread.
+
+    The device (a Microphone, or an AudioFile for offline replay) is opened
+    once in start() and stays open until stop().
+    """
+
+    def __init__(self, device: sr.AudioSource, buffer_seconds: float = DEFAULT_BUFFER_SECONDS):
+        """
+        Args:
+            device: speech_recognition audio source to capture from
+            buffer_seconds: Amount of audio the ring buffer holds
+        """
+        self.device = device
+        self.buffer_seconds = buffer_seconds
+        self.ring: Optional[AudioRingBuffer] = None
+        # Why the last capture ended, or None if it ended normally (stop() or end of file)
+        self.error: Optional[Exception] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Open the device and start the capture thread. Raises OSError if the device cannot be opened."""
+        if self._thread and self._thread.is_alive():
+            return
+        self.device.__enter__()
+        bytes_per_second = self.device.SAMPLE_RATE * self.device.SAMPLE_WIDTH
+        self.ring = AudioRingBuffer(int(self.buffer_seconds * bytes_per_second))
+        self.error = None
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._capture_loop, name='audio-capture', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop capturing and close the device."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.ring:
+            self.ring.close()
+
+    def open_reader(self, from_oldest: bool = False) -> BufferedAudioSource:
+        """
+        Create a consumer of the captured audio.
+
+        Args:
+            from_oldest: Start at the oldest buffered audio instead of the live end
+        """
+        if self.ring is None:
+            raise RuntimeError("AudioCapture must be started before opening a reader")
+        cursor = max(0, self.ring.write_position - self.ring.capacity) if from_oldest else None
+        return BufferedAudioSource(self.ring, self.device.SAMPLE_RATE,
+                                   self.device.SAMPLE_WIDTH, self.device.CHUNK, cursor)
+
+    def _capture_loop(self):
+        try:
+            while not self._stop_event.is_set():
+                data = self.device.stream.read(self.device.CHUNK)
+                if not data:
+                    break  # End of a file-backed stream
+                self.ring.write(data)
+        except Exception as e:
+            logging.error(f"Audio capture stopped: {e}")
+            self.error = e
+        finally:
+            self.ring.close()
+            try:
+                self.device.__exit__(None, None, None)
+            except Exception:
+                pass
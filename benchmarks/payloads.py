@@ -0,0 +1,132 @@
+import itertools
+import random
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+# Default share of each payload kind in a generated workload
+DEFAULT_MIX = {'text': 0.45, 'activate': 0.1, 'bino': 0.1, 'status': 0.25, 'batch': 0.1}
+
+class WebhookEvent(NamedTuple):
+    kind: str
+    payload: dict
+    trigger: Optional[str] = None  # Number that raises an alert, for 'bino' events
+
+def text_message(message_id: str, from_number: str, body: str) -> dict:
+    """Build an incoming text message as delivered by the WhatsApp Cloud API."""
+    return {
+        'from': from_number,
+        'id': message_id,
+        'timestamp': str(int(time.time())),
+        'type': 'text',
+        'text': {'body': body}
+    }
+
+def status_update(message_id: str, recipient: str, status: str = 'delivered') -> dict:
+    """Build a delivery status callback for an outbound message."""
+    return {
+        'id': message_id,
+        'recipient_id': recipient,
+        'status': status,
+        'timestamp': str(int(time.time()))
+    }
+
+def webhook_payload(entries: List[dict]) -> dict:
+    """
+    Wrap change values into a webhook payload, one entry per value.
+
+    Args:
+        entries: 'value' objects, e.g. {'messages': [...]} or {'statuses': [...]}
+    """
+    return {
+        'object': 'whatsapp_business_account',
+        'entry': [
+            {
+                'id': f"waba-{i}",
+                'changes': [{
+                    'field': 'messages',
+                    'value': {
+                        'messaging_product': 'whatsapp',
+                        'metadata': {'display_phone_number': '15550000000', 'phone_number_id': '1000'},
+                        **value
+                    }
+                }]
+            }
+            for i, value in enumerate(entries)
+        ]
+    }
+
+class WorkloadGenerator:
+    """
+    Generates synthetic webhook traffic.
+
+    'bino' events come from numbers returned by trigger_numbers(), which the
+    benchmark activates during warm-up, so every one of them raises an alert.
+    """
+
+    def __init__(self, mix: Dict[str, float] = None, seed: int = 0, members: int = 50):
+        """
+        Args:
+            mix: Relative weight of each kind ('text', 'activate', 'bino', 'status', 'batch')
+            seed: Random seed, so runs are reproducible
+            members: Size of the pool of ordinary senders
+        """
+        self.mix = mix or DEFAULT_MIX
+        self.random = random.Random(seed)
+        self.members = [f"1555{i:07d}" for i in range(members)]
+        self._ids = itertools.count()
+        self._fresh_numbers = (f"1666{i:07d}" for i in itertools.count())
+        self._trigger_numbers: List[str] = []
+
+    def _message_id(self) -> str:
+        return f"wamid.bench{next(self._ids)}"
+
+    def generate(self, count: int) -> List[WebhookEvent]:
+        """Generate count events drawn from the configured mix."""
+        kinds = self.random.choices(list(self.mix), weights=list(self.mix.values()), k=count)
+        return [self._event(kind) for kind in kinds]
+
+    def trigger_numbers(self) -> List[str]:
+        """Numbers used by generated 'bino' events."""
+        return list(self._trigger_numbers)
+
+    def seed_payloads(self, contacts: int = 10) -> List[dict]:
+        """Warm-up payloads: recent contacts to alert, then activation of every trigger number."""
+        payloads = [webhook_payload([{'messages': [text_message(self._message_id(), number, 'hello')]}])
+                    for number in self.members[:contacts]]
+        payloads += [webhook_payload([{'messages': [text_message(self._message_id(), number, 'activate')]}])
+                     for number in self._trigger_numbers]
+        return payloads
+
+    def _event(self, kind: str) -> WebhookEvent:
+        if kind == 'text':
+            number = self.random.choice(self.members)
+            message = text_message(self._message_id(), number, 'just checking in')
+            return WebhookEvent(kind, webhook_payload([{'messages': [message]}]))
+
+        if kind == 'activate':
+            message = text_message(self._message_id(), next(self._fresh_numbers), 'activate')
+            return WebhookEvent(kind, webhook_payload([{'messages': [message]}]))
+
+        if kind == 'bino':
+            number = next(self._fresh_numbers)
+            self._trigger_numbers.append(number)
+            message = text_message(self._message_id(), number, 'bino')
+            return WebhookEvent(kind, webhook_payload([{'messages': [message]}]), trigger=number)
+
+        if kind == 'status':
+            statuses = [status_update(self._message_id(), self.random.choice(self.members),
+                                      self.random.choice(['sent', 'delivered', 'read']))]
+            return WebhookEvent(kind, webhook_payload([{'statuses': statuses}]))
+
+        if kind == 'batch':
+            entries = []
+            for _ in range(self.random.randint(2, 5)):
+                if self.random.random() < 0.5:
+                    entries.append({'statuses': [status_update(self._message_id(), self.random.choice(self.members))]})
+                else:
+                    messages = [text_message(self._message_id(), self.random.choice(self.members), 'batched')
+                                for _ in range(self.random.randint(1, 3))]
+                    entries.append({'messages': messages})
+            return WebhookEvent(kind, webhook_payload(entries))
+
+        raise ValueError(f"Unknown payload kind: {kind}")
@@ -0,0 +1,419 @@
+"""
+Offline replay harness for the speech pipeline.
+
+Feeds recorded WAV clips through SpeechHandler's real listen/VAD/match state
+machine (start_listening, listen_for_wake_word, listen_for_emergency) via
+sr.AudioFile, with a stub recognizer backend and stub location and WhatsApp
+services, and reports detection accuracy per stage and wake-to-alert latency.
+
+A corpus is a directory of WAV clips with a manifest.json:
+
+    {
+      "wake_word": "bino",
+      "emergency_phrases": ["i'm in danger", "help me", "emergency", "i need help"],
+      "cases": [
+        {"name": "wake_then_help", "clips": ["bino.wav", "help_me.wav"],
+         "expect_wake": true, "expect_alert": true}
+      ]
+    }
+
+The stub recognizer returns the transcript in the .txt file next to each clip
+(clips without one, e.g. noise, are not understood).
+
+Example:
+    python benchmarks/speech_replay.py                      # synthetic corpus
+    python benchmarks/speech_replay.py --corpus my_corpus --recognizer-latency 0.4
+    python benchmarks/speech_replay.py --corpus my_corpus --recognizer google --realtime
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from types import SimpleNamespace
+from typing import Dict, List, NamedTuple, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [REPO_ROOT, BENCH_DIR]
+
+import speech_recognition as sr
+
+from audio_buffer import DEFAULT_BUFFER_SECONDS
+from stubs import StubLocationService, StubTransport, StubWhatsAppSender
+from webhook_bench import percentiles
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+# Silence appended to every case so the emergency listen can time out before the stream ends
+TRAILING_SILENCE = 6.0
+# Frames per read of sr.Microphone's default stream
+MICROPHONE_CHUNK = 1024
+DEFAULT_PHRASES = ["i'm in danger", "help me", "emergency", "i need help"]
+
+class Clip(NamedTuple):
+    name: str
+    frames: bytes  # 16 kHz, 16-bit mono PCM
+    transcript: Optional[str]
+
+class ReplayCase(NamedTuple):
+    name: str
+    frames: bytes
+    segments: List[tuple]  # (start_byte, end_byte, transcript) per clip
+    expect_wake: bool
+    expect_alert: bool
+
+    @property
+    def duration(self) -> float:
+        return len(self.frames) / (SAMPLE_RATE * SAMPLE_WIDTH)
+
+    def wav(self) -> io.BytesIO:
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(SAMPLE_WIDTH)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(self.frames)
+        buffer.seek(0)
+        return buffer
+
+def load_clip(path: str) -> Clip:
+    """Load a clip as 16 kHz 16-bit mono, with the transcript from its .txt sidecar if present."""
+    with sr.AudioFile(path) as source:
+        audio = sr.Recognizer().record(source)
+    frames = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=SAMPLE_WIDTH)
+    transcript = None
+    transcript_path = os.path.splitext(path)[0] + '.txt'
+    if os.path.exists(transcript_path):
+        with open(transcript_path) as f:
+            transcript = f.read().strip() or None
+    return Clip(os.path.basename(path), frames, transcript)
+
+def load_corpus(corpus_dir: str) -> dict:
+    with open(os.path.join(corpus_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    clips: Dict[str, Clip] = {}
+    cases = []
+    silence = bytes(int(TRAILING_SILENCE * SAMPLE_RATE) * SAMPLE_WIDTH)
+    for spec in manifest['cases']:
+        frames, segments = b'', []
+        for name in spec['clips']:
+            if name not in clips:
+                clips[name] = load_clip(os.path.join(corpus_dir, name))
+            clip = clips[name]
+            segments.append((len(frames), len(frames) + len(clip.frames), clip.transcript))
+            frames += clip.frames
+        cases.append(ReplayCase(spec['name'], frames + silence, segments,
+                                bool(spec.get('expect_wake')), bool(spec.get('expect_alert'))))
+    manifest['cases'] = cases
+    return manifest
+
+class StubRecognizer:
+    """
+    Recognizer backend that looks up the transcript of the replayed clip.
+
+    The VAD hands the recognizer an exact slice of the replayed stream, so the
+    clip it came from is found by locating a sample of its bytes in the case.
+    """
+
+    PROBE_BYTES = 1024
+
+    def __init__(self, case: ReplayCase, latency: float = 0.0):
+        self.case = case
+        self.latency = latency
+
+    def __call__(self, audio: sr.AudioData):
+        time.sleep(self.latency)
+        raw = audio.get_raw_data()
+        middle = (len(raw) // 2) & ~(SAMPLE_WIDTH - 1)
+        position = self.case.frames.find(raw[middle:middle + self.PROBE_BYTES])
+        for start, end, transcript in self.case.segments:
+            if start <= position < end and transcript:
+                return {'alternative': [{'transcript': transcript, 'confidence': 0.9}], 'final': True}
+        return []
+
+class _PacedStream:
+    """Releases file audio no faster than the given speed relative to real time."""
+
+    def __init__(self, stream, bytes_per_second: float):
+        self.stream = stream
+        self.bytes_per_second = bytes_per_second
+        self.start = None
+        self.delivered = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self.start is None:
+            self.start = time.perf_counter()
+        data = self.stream.read(size)
+        self.delivered += len(data)
+        delay = self.start + self.delivered / self.bytes_per_second - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return data
+
+class ReplayAudioFile(sr.AudioFile):
+    """
+    AudioFile read in microphone-sized chunks, optionally paced.
+
+    At speed 1.0 it delivers audio like a live microphone; without a speed it
+    is read as fast as the pipeline consumes it.
+    """
+
+    def __init__(self, filename_or_fileobject, speed: Optional[float] = None, chunk: int = MICROPHONE_CHUNK):
+        super().__init__(filename_or_fileobject)
+        self.speed = speed
+        self.chunk = chunk
+
+    def __enter__(self):
+        super().__enter__()
+        # Endpointing works in whole chunks, so match the microphone's granularity
+        self.CHUNK = self.chunk
+        if self.speed:
+            self.stream = _PacedStream(self.stream, self.SAMPLE_RATE * self.SAMPLE_WIDTH * self.speed)
+        return self
+
+def run_case(case: ReplayCase, manifest: dict, args) -> dict:
+    """Replay one case through SpeechHandler.start_listening and record what it detected."""
+    from main import BinoEmergencyAssistant
+    from location_tracker import LocationTracker
+    from transports import HedgedDelivery
+    from speech_handler import SpeechHandler
+
+    if args.speed is None and case.duration > DEFAULT_BUFFER_SECONDS:
+        raise ValueError(f"Case {case.name} is {case.duration:.0f}s long; replay it with --realtime "
+                         f"or --speed, or keep cases under {DEFAULT_BUFFER_SECONDS:.0f}s")
+
+    device = ReplayAudioFile(case.wav(), args.speed)
+    recognize = StubRecognizer(case, args.recognizer_latency) if args.recognizer == 'stub' else None
+    recognition_times: Dict[str, List[float]] = {'wake': [], 'emergency': []}
+    detections: List[tuple] = []  # (stage, wall time, audio position in seconds)
+    stage = {'name': 'wake'}
+    sender = StubTransport(args.send_latency)
+    # handle_emergency only needs these services and the trusted contacts
+    assistant = SimpleNamespace(location_service=StubLocationService(args.location_latency),
+                                whatsapp_sender=StubWhatsAppSender(),
+                                delivery=HedgedDelivery([sender]),
+                                # Live tracking is disabled; it would only add sends after each case
+                                location_tracker=LocationTracker(None, None, duration=0),
+                                config=SimpleNamespace(contacts=('+10000000000',)))
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else log):
+        handler = SpeechHandler(wake_word=manifest.get('wake_word', 'bino'),
+                                emergency_phrases=manifest.get('emergency_phrases', DEFAULT_PHRASES),
+                                calibration_path=None, device=device, recognize=recognize,
+                                auto_calibrate=False)
+        handler.alert_cooldown = 0
+        bytes_per_second = handler.source.SAMPLE_RATE * handler.source.SAMPLE_WIDTH
+
+        def position() -> float:
+            return handler.source.stream.cursor / bytes_per_second
+
+        def timed_recognize(audio):
+            began = time.perf_counter()
+            try:
+                return backend(audio)
+            finally:
+                recognition_times[stage['name']].append(time.perf_counter() - began)
+
+        def tracked(name, listen):
+            def wrapper(*a, **kw):
+                stage['name'] = name
+                detected = listen(*a, **kw)
+                if detected:
+                    detections.append((name, time.perf_counter(), position()))
+                return detected
+            return wrapper
+
+        backend = handler.recognize
+        handler.recognize = timed_recognize
+        handler.listen_for_wake_word = tracked('wake', handler.listen_for_wake_word)
+        handler.listen_for_emergency = tracked('emergency', handler.listen_for_emergency)
+
+        alert_positions: List[float] = []
+
+        def on_emergency():
+            alert_positions.append(position())
+            BinoEmergencyAssistant.handle_emergency(assistant)
+
+        listener = threading.Thread(target=handler.start_listening, args=(on_emergency,), daemon=True)
+        listener.start()
+        # Stop once the whole recording has been captured and consumed
+        while listener.is_alive():
+            ring = handler.capture.ring
+            if ring.closed and handler.source.stream.cursor >= ring.write_position:
+                handler.is_listening = False
+            listener.join(timeout=0.01)
+
+    wake_events = [d for d in detections if d[0] == 'wake']
+    result = {
+        'name': case.name,
+        'expect_wake': case.expect_wake,
+        'wake': bool(wake_events),
+        'expect_alert': case.expect_alert,
+        'alert': bool(sender.alerts),
+        'recognitions': {name: len(times) for name, times in recognition_times.items()},
+        'recognition_times': recognition_times,
+    }
+    if sender.alerts and wake_events:
+        first_alert = sender.alerts[0]
+        wake = [d for d in wake_events if d[1] <= first_alert][-1]
+        result['wake_to_alert_s'] = first_alert - wake[1]
+        result['wake_to_alert_audio_s'] = alert_positions[0] - wake[2]
+    if args.verbose:
+        print(log.getvalue())
+    return result
+
+def confusion(pairs: List[tuple]) -> dict:
+    """Accuracy, precision and recall from (expected, detected) pairs."""
+    tp = sum(1 for e, d in pairs if e and d)
+    fp = sum(1 for e, d in pairs if not e and d)
+    fn = sum(1 for e, d in pairs if e and not d)
+    tn = sum(1 for e, d in pairs if not e and not d)
+    return {
+        'cases': len(pairs), 'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+        'accuracy': round((tp + tn) / len(pairs), 3) if pairs else None,
+        'precision': round(tp / (tp + fp), 3) if tp + fp else None,
+        'recall': round(tp / (tp + fn), 3) if tp + fn else None,
+    }
+
+def summarize(results: List[dict]) -> dict:
+    # The emergency stage is only reached, and judged, when the wake word was detected
+    reached = [r for r in results if r['wake']]
+    return {
+        'cases': [{k: v for k, v in r.items() if k != 'recognition_times'} for r in results],
+        'wake_stage': confusion([(r['expect_wake'], r['wake']) for r in results]),
+        'emergency_stage': confusion([(r['expect_alert'], r['alert']) for r in reached]),
+        'end_to_end': confusion([(r['expect_alert'], r['alert']) for r in results]),
+        'latency_ms': {
+            'wake_to_alert': percentiles([r['wake_to_alert_s'] for r in results if 'wake_to_alert_s' in r]),
+            'wake_to_alert_audio': percentiles([r['wake_to_alert_audio_s'] for r in results
+                                                if 'wake_to_alert_audio_s' in r]),
+            'recognize_wake': percentiles([t for r in results for t in r['recognition_times']['wake']]),
+            'recognize_emergency': percentiles([t for r in results for t in r['recognition_times']['emergency']]),
+        },
+    }
+
+def _synthetic_speech(seconds: float, f0: float, rng: random.Random) -> List[float]:
+    """Voiced, syllable-modulated harmonic tone: passes the VAD like speech does."""
+    samples = []
+    n = int(seconds * SAMPLE_RATE)
+    for i in range(n):
+        t = i / SAMPLE_RATE
+        envelope = math.sin(math.pi * i / n) * (0.55 + 0.45 * math.sin(2 * math.pi * 4 * t))
+        tone = sum(math.sin(2 * math.pi * f0 * h * t) / h for h in range(1, 5))
+        samples.append(6000 * envelope * tone + rng.gauss(0, 40))
+    return samples
+
+def make_corpus(corpus_dir: str):
+    """Write a small synthetic corpus: speech-like clips with transcripts, silence and noise."""
+    rng = random.Random(0)
+    os.makedirs(corpus_dir, exist_ok=True)
+    phrases = {
+        'bino': ('bino', 0.6, 140),
+        'help_me': ('help me', 0.8, 165),
+        'im_in_danger': ("i'm in danger", 1.1, 150),
+        'emergency': ('emergency', 0.9, 175),
+        'what_time': ('what time is it', 1.2, 130),
+        # Near misses of the wake word, which must not wake the assistant
+        'been_there': ('i have been there', 1.1, 135),
+        'bone': ('bone', 0.5, 145),
+        'bingo': ('bingo', 0.6, 150),
+    }
+    clips = {name: [0.0] * int(0.3 * SAMPLE_RATE) + _synthetic_speech(seconds, f0, rng)
+             + [0.0] * int(1.2 * SAMPLE_RATE)
+             for name, (_, seconds, f0) in phrases.items()}
+    clips['noise'] = [rng.gauss(0, 2500) for _ in range(int(2.0 * SAMPLE_RATE))]
+    clips['silence'] = [0.0] * SAMPLE_RATE
+
+    for name, samples in clips.items():
+        with wave.open(os.path.join(corpus_dir, f"{name}.wav"), 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(SAMPLE_WIDTH)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(b''.join(int(max(-32768, min(32767, s))).to_bytes(2, 'little', signed=True)
+                                   for s in samples))
+        if name in phrases:
+            with open(os.path.join(corpus_dir, f"{name}.txt"), 'w') as f:
+                f.write(phrases[name][0] + '\n')
+
+    cases = [
+        ('wake_then_help', ['silence.wav', 'bino.wav', 'help_me.wav'], True, True),
+        ('wake_then_danger', ['bino.wav', 'im_in_danger.wav'], True, True),
+        ('wake_then_emergency', ['bino.wav', 'emergency.wav'], True, True),
+        ('wake_then_silence', ['bino.wav'], True, True),
+        ('wake_then_noise', ['bino.wav', 'noise.wav'], True, True),
+        ('wake_then_chatter', ['bino.wav', 'what_time.wav'], True, False),
+        # Noise is not silence: the speech after it still gets its chance
+        ('wake_noise_then_chatter', ['bino.wav', 'noise.wav', 'what_time.wav'], True, False),
+        ('phrase_without_wake', ['help_me.wav'], False, False),
+        ('chatter_only', ['what_time.wav', 'silence.wav'], False, False),
+        ('near_miss_been', ['been_there.wav', 'silence.wav'], False, False),
+        ('near_miss_bone', ['bone.wav', 'help_me.wav'], False, False),
+        ('near_miss_bingo', ['bingo.wav', 'silence.wav'], False, False),
+        ('noise_only', ['noise.wav'], False, False),
+        ('silence_only', ['silence.wav'], False, False),
+    ]
+    with open(os.path.join(corpus_dir, 'manifest.json'), 'w') as f:
+        json.dump({
+            'wake_word': 'bino',
+            'emergency_phrases': DEFAULT_PHRASES,
+            'cases': [{'name': name, 'clips': clip_names, 'expect_wake': wake, 'expect_alert': alert}
+                      for name, clip_names, wake, alert in cases]
+        }, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded audio through the speech pipeline')
+    parser.add_argument('--corpus', help='Corpus directory with manifest.json (default: a synthetic corpus)')
+    parser.add_argument('--make-corpus', metavar='DIR', help='Write the synthetic corpus to DIR and exit')
+    parser.add_argument('--recognizer', choices=['stub', 'google'], default='stub',
+                        help='Recognition backend; google needs network access')
+    parser.add_argument('--recognizer-latency', type=float, default=0.0,
+                        help='Simulated stub recognizer round-trip (s)')
+    parser.add_argument('--location-latency', type=float, default=0.0, help='Stub location lookup latency (s)')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='Stub alert send latency (s)')
+    parser.add_argument('--realtime', dest='speed', action='store_const', const=1.0,
+                        help='Play audio back in real time, as a microphone would')
+    parser.add_argument('--speed', type=float, help='Play audio back at this multiple of real time')
+    parser.add_argument('--case', action='append', help='Only run the named case (repeatable)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show SpeechHandler output')
+    args = parser.parse_args()
+
+    if args.make_corpus:
+        make_corpus(args.make_corpus)
+        print(f"Synthetic corpus written to {args.make_corpus}")
+        return
+
+    corpus_dir = args.corpus
+    if corpus_dir is None:
+        corpus_dir = tempfile.mkdtemp(prefix='bino-corpus-')
+        make_corpus(corpus_dir)
+    manifest = load_corpus(corpus_dir)
+
+    results = []
+    for case in manifest['cases']:
+        if args.case and case.name not in args.case:
+            continue
+        result = run_case(case, manifest, args)
+        status = 'ok' if (result['wake'], result['alert']) == (case.expect_wake, case.expect_alert) else 'MISMATCH'
+        print(f"{case.name:24} wake={result['wake']!s:5} alert={result['alert']!s:5} {status}")
+        results.append(result)
+
+    report = summarize(results)
+    print(json.dumps({k: v for k, v in report.items() if k != 'cases'}, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
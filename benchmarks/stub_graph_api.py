@@ -0,0 +1,127 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+class StubGraphAPI:
+    """
+    Local stand-in for the WhatsApp Cloud API messages endpoint.
+
+    Accepts POST /<version>/<phone_number_id>/messages with configurable
+    latency and error rates, and records every accepted message with the
+    time it arrived so benchmarks can measure end-to-end delivery.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                 jitter: float = 0.02, error_rate: float = 0.0, rate_limit_rate: float = 0.0):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            latency: Mean response latency in seconds
+            jitter: Maximum random deviation from the mean latency, in seconds
+            error_rate: Fraction of requests answered with HTTP 500
+            rate_limit_rate: Fraction of requests answered with HTTP 429
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.received: List[Dict] = []
+        self.status_counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v19.0/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-graph-api', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def messages_to(self, number: str) -> List[Dict]:
+        """Return recorded messages for a recipient (with or without a leading '+')."""
+        number = number.lstrip('+')
+        with self._lock:
+            return [m for m in self.received if m['to'].lstrip('+') == number]
+
+    def _record(self, status: int, payload: Optional[dict] = None):
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if payload is not None:
+                self.received.append({
+                    'to': payload.get('to', ''),
+                    'body': payload.get('text', {}).get('body', ''),
+                    'received_at': time.perf_counter()
+                })
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: dict, headers: Optional[dict] = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                # Used by WhatsAppSender.warm_up()
+                self._reply(200, {'status': 'ok'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                time.sleep(max(0.0, stub.latency + random.uniform(-stub.jitter, stub.jitter)))
+
+                roll = random.random()
+                if roll < stub.error_rate:
+                    stub._record(500)
+                    self._reply(500, {'error': {'message': 'Stub internal error'}})
+                elif roll < stub.error_rate + stub.rate_limit_rate:
+                    stub._record(429)
+                    self._reply(429, {'error': {'message': 'Stub rate limit'}}, {'Retry-After': '0.1'})
+                else:
+                    stub._record(200, payload)
+                    self._reply(200, {'messages': [{'id': f"wamid.stub{time.perf_counter_ns()}"}]})
+
+        return Handler
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a stub WhatsApp Cloud API server')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubGraphAPI(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate)
+    print(f"Stub Graph API listening at {server.base_url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
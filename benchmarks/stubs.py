@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence
+
+from transports import Transport
+
+class StubLocationService:
+    """Fixed location with a configurable lookup delay, instead of IP geolocation."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def get_current_location(self, max_age=None) -> dict:
+        time.sleep(self.latency)
+        return {'address': 'Benchmark Street 1', 'maps_link': 'https://www.google.com/maps?q=0,0', 'age': 0}
+
+class StubWhatsAppSender:
+    """Formats alerts like WhatsAppSender, without any configuration."""
+
+    def format_emergency_alert(self, location: dict) -> str:
+        return f"EMERGENCY ALERT at {location.get('address')}: {location.get('maps_link')}"
+
+class StubTransport(Transport):
+    """Records emergency alerts instead of sending them."""
+
+    name = 'stub'
+
+    def __init__(self, latency: float = 0.0, succeed: bool = True):
+        self.latency = latency
+        self.succeed = succeed
+        # perf_counter() timestamp of every alert, in order
+        self.alerts: List[float] = []
+
+    def submit(self, recipients: Sequence[str], message: str) -> Dict[str, Future]:
+        time.sleep(self.latency)
+        self.alerts.append(time.perf_counter())
+        futures = {}
+        for recipient in recipients:
+            futures[recipient] = Future()
+            futures[recipient].set_result(self.succeed)
+        return futures
+
+    @property
+    def last_alert(self) -> Optional[float]:
+        return self.alerts[-1] if self.alerts else None
@@ -0,0 +1,285 @@
+"""
+Load test and latency benchmark for webhook.py.
+
+Replays synthetic WhatsApp webhook payloads against the Flask app at a fixed
+request rate, with WhatsAppSender pointed at a local stub Graph API, and
+reports throughput plus p50/p95/p99 latency for the webhook acknowledgement
+and for end-to-end alert delivery ('bino' received -> confirmation delivered
+to the Graph API).
+
+Example:
+    python benchmarks/webhook_bench.py --requests 2000 --rate 200
+    python benchmarks/webhook_bench.py --compare benchmarks/baselines/default.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [REPO_ROOT, BENCH_DIR]
+
+from payloads import DEFAULT_MIX, WorkloadGenerator
+from stub_graph_api import StubGraphAPI
+from stubs import StubLocationService
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = {
+    'throughput_rps': True,
+    'ack_latency_ms.p50': False,
+    'ack_latency_ms.p95': False,
+    'ack_latency_ms.p99': False,
+    'alerts.e2e_latency_ms.p50': False,
+    'alerts.e2e_latency_ms.p95': False,
+    'alerts.e2e_latency_ms.p99': False,
+}
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 and max, in milliseconds."""
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000, 2)
+
+    return {'p50': rank(50), 'p95': rank(95), 'p99': rank(99), 'max': round(ordered[-1] * 1000, 2)}
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight)
+    return mix
+
+def load_webhook(args, stub: StubGraphAPI, workdir: str):
+    """Import webhook.py configured against the stub Graph API."""
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump({
+            'whatsapp_token': 'benchmark',
+            'whatsapp_phone_number_id': '1000',
+            'graph_api_base_url': stub.base_url,
+            'outbox_path': os.path.join(workdir, 'outbox.db'),
+            'whatsapp_rate_limit': args.send_rate_limit,
+            'whatsapp_rate_burst': args.send_rate_limit,
+            'http_max_retries': 3,
+            # Live tracking would add location updates after each alert
+            'tracking_duration': 0,
+        }, f)
+    os.environ.update({
+        'WEBHOOK_WORKERS': str(args.workers),
+        'WEBHOOK_QUEUE_SIZE': str(args.queue_size),
+        'WEBHOOK_FAST_ACK': 'true' if args.fast_ack else 'false',
+        'STATE_BACKEND': 'memory',
+        'USER_NAME': 'Benchmark',
+    })
+    # WhatsAppSender reads config.json from the working directory
+    os.chdir(workdir)
+    # webhook.py builds its LocationService at import, and a real one starts
+    # refreshing (IP geolocation, gpsd) straight away, so swap in the stub first
+    import location_service
+    location_service.LocationService = lambda **kwargs: StubLocationService(args.location_latency)
+    import webhook
+    return webhook
+
+class WebhookClient:
+    """Keep-alive HTTP client, one connection per thread."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def post(self, payload: dict) -> int:
+        body = json.dumps(payload)
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                conn.request('POST', '/webhook', body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        return 0
+
+def run_benchmark(args) -> dict:
+    from werkzeug.serving import make_server
+
+    stub = StubGraphAPI(latency=args.graph_latency, jitter=args.graph_jitter,
+                        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    stub.start()
+    workdir = tempfile.mkdtemp(prefix='bino-bench-')
+    webhook = load_webhook(args, stub, workdir)
+
+    # One access-log line per request would dominate the run
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, webhook.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-webhook', daemon=True).start()
+    client = WebhookClient('127.0.0.1', server.server_port)
+
+    generator = WorkloadGenerator(parse_mix(args.mix), seed=args.seed)
+    events = generator.generate(args.requests)
+
+    # Warm-up: seed recent contacts and activate every trigger number
+    for payload in generator.seed_payloads():
+        client.post(payload)
+    deadline = time.monotonic() + 30
+    while webhook.work_queue.stats()['depth'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.2)
+
+    ack_latencies: List[float] = []
+    status_codes: Dict[int, int] = {}
+    sent_at: Dict[str, float] = {}
+    lock = threading.Lock()
+
+    def send(index: int, start: float):
+        event = events[index]
+        # Open-loop pacing: each request has a fixed slot, regardless of how slow earlier ones were
+        delay = start + index / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        began = time.perf_counter()
+        status = client.post(event.payload)
+        elapsed = time.perf_counter() - began
+        with lock:
+            ack_latencies.append(elapsed)
+            status_codes[status] = status_codes.get(status, 0) + 1
+            if event.trigger:
+                sent_at[event.trigger] = began
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: send(i, start), range(len(events))))
+    duration = time.perf_counter() - start
+
+    # Wait for every alert confirmation to reach the stub Graph API
+    triggers = [e.trigger for e in events if e.trigger]
+    e2e: List[float] = []
+    deadline = time.monotonic() + args.drain_timeout
+    pending = set(triggers)
+    while pending and time.monotonic() < deadline:
+        for number in list(pending):
+            confirmations = [m for m in stub.messages_to(number)
+                             if m['body'].startswith(('✅', '❌'))]
+            if confirmations:
+                e2e.append(confirmations[0]['received_at'] - sent_at[number])
+                pending.discard(number)
+        time.sleep(0.05)
+
+    report = {
+        'config': {
+            'requests': args.requests, 'rate': args.rate, 'concurrency': args.concurrency,
+            'mix': parse_mix(args.mix), 'workers': args.workers, 'fast_ack': args.fast_ack,
+            'graph_latency': args.graph_latency, 'error_rate': args.error_rate,
+            'rate_limit_rate': args.rate_limit_rate, 'location_latency': args.location_latency,
+        },
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(events) / duration, 2),
+        'ack_latency_ms': percentiles(ack_latencies),
+        'status_codes': {str(code): n for code, n in sorted(status_codes.items())},
+        'alerts': {
+            'triggered': len(triggers),
+            'confirmed': len(e2e),
+            'e2e_latency_ms': percentiles(e2e),
+        },
+        'graph_api': {str(code): n for code, n in sorted(stub.status_counts.items())},
+        'work_queue': webhook.work_queue.stats(),
+        'send_queue': webhook.whatsapp.scheduler.stats(),
+    }
+
+    server.shutdown()
+    stub.stop()
+    return report
+
+def _lookup(report: dict, dotted: str) -> Optional[float]:
+    value = report
+    for key in dotted.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Print each compared metric against the baseline.
+
+    Returns:
+        List[str]: Metrics that regressed by more than the tolerance
+    """
+    regressions = []
+    print(f"\n{'metric':32} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = _lookup(baseline, metric), _lookup(report, metric)
+        if old is None or new is None or old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = '  REGRESSION' if worse > tolerance else ''
+        print(f"{metric:32} {old:>10.2f} {new:>10.2f} {change:>+7.1%}{flag}")
+        if worse > tolerance:
+            regressions.append(metric)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark webhook.py against a stub Graph API')
+    parser.add_argument('--requests', type=int, default=1000, help='Number of webhook requests')
+    parser.add_argument('--rate', type=float, default=100.0, help='Target requests per second')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+    parser.add_argument('--mix', default=','.join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help='Payload mix, e.g. text=0.5,bino=0.1,status=0.4')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=4, help='WEBHOOK_WORKERS for the app')
+    parser.add_argument('--queue-size', type=int, default=1000, help='WEBHOOK_QUEUE_SIZE for the app')
+    parser.add_argument('--no-fast-ack', dest='fast_ack', action='store_false',
+                        help='Process payloads inside the request')
+    parser.add_argument('--graph-latency', type=float, default=0.05, help='Stub Graph API latency (s)')
+    parser.add_argument('--graph-jitter', type=float, default=0.02, help='Stub Graph API latency jitter (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub HTTP 500 responses')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of stub HTTP 429 responses')
+    parser.add_argument('--send-rate-limit', type=float, default=1000.0,
+                        help='whatsapp_rate_limit configured for the sender (msgs/s)')
+    parser.add_argument('--location-latency', type=float, default=0.0, help='Stub location lookup latency (s)')
+    parser.add_argument('--drain-timeout', type=float, default=60.0,
+                        help='Seconds to wait for alert confirmations after the run')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    parser.add_argument('--save-baseline', help='Save the report as a baseline file')
+    parser.add_argument('--compare', help='Baseline file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative regression before --compare fails')
+    args = parser.parse_args()
+
+    # Resolve output paths before the benchmark changes the working directory
+    output_paths = [os.path.abspath(p) for p in (args.output, args.save_baseline) if p]
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+    for path in output_paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+# Seconds between checks of config.json and .env for changes
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_GRAPH_API_BASE_URL = "https://graph.facebook.com/v19.0/"
+
+# Environment variables that override config.json keys
+ENV_KEYS = {
+    'TRUSTED_CONTACT': 'trusted_contact',
+    'TRUSTED_CONTACTS': 'trusted_contacts',
+    'USER_NAME': 'user_name',
+    'EMERGENCY_MESSAGE': 'emergency_message',
+    'WHATSAPP_TOKEN': 'whatsapp_token',
+    'WHATSAPP_PHONE_NUMBER_ID': 'whatsapp_phone_number_id',
+    'VERIFY_TOKEN': 'verify_token',
+    'GRAPH_API_BASE_URL': 'graph_api_base_url',
+    'WHATSAPP_DAEMON_URL': 'whatsapp_daemon_url',
+    'LOCATION_PUSH_TOKEN': 'location_push_token',
+}
+
+def normalize_phone(number: str) -> Optional[str]:
+    """
+    Normalize a phone number to E.164 (+ and 8 to 15 digits).
+
+    Returns:
+        str: The normalized number, or None if it is not a plausible number
+    """
+    digits = ''.join(c for c in str(number) if c.isdigit())
+    if not 8 <= len(digits) <= 15:
+        return None
+    return f"+{digits}"
+
+class ConfigSnapshot(NamedTuple):
+    """
+    Immutable view of the configuration at one point in time.
+
+    Derived values used on hot paths (normalized contacts, Graph API URL and
+    headers) are computed once when the snapshot is built.
+    """
+    values: Mapping[str, Any]
+    contacts: Tuple[str, ...]  # Trusted contacts in E.164 form, deduplicated
+    user_name: Optional[str]
+    verify_token: str
+    graph_base_url: str
+    graph_messages_url: Optional[str]  # None when no phone number ID is configured
+    graph_headers: Mapping[str, str]
+    version: int
+    loaded_at: float
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    @property
+    def trusted_contact(self) -> Optional[str]:
+        return self.contacts[0] if self.contacts else None
+
+def build_snapshot(values: Dict[str, Any], version: int = 0) -> ConfigSnapshot:
+    """Freeze merged configuration values and precompute the derived fields."""
+    raw_contacts: List[str] = []
+    for key in ('trusted_contact', 'trusted_contacts'):
+        value = values.get(key)
+        if isinstance(value, str):
+            raw_contacts.extend(value.split(','))
+        elif isinstance(value, (list, tuple)):
+            raw_contacts.extend(str(v) for v in value)
+    contacts = []
+    for raw in raw_contacts:
+        if not raw.strip():
+            continue
+        number = normalize_phone(raw)
+        if number is None:
+            logging.warning(f"Ignoring invalid trusted contact number: {raw.strip()}")
+        elif number not in contacts:
+            contacts.append(number)
+
+    base_url = values.get('graph_api_base_url') or DEFAULT_GRAPH_API_BASE_URL
+    if not base_url.endswith('/'):
+        base_url = f"{base_url}/"
+    phone_number_id = values.get('whatsapp_phone_number_id')
+
+    return ConfigSnapshot(
+        values=MappingProxyType(dict(values)),
+        contacts=tuple(contacts),
+        user_name=values.get('user_name'),
+        verify_token=values.get('verify_token') or 'bino_emergency',
+        graph_base_url=base_url,
+        graph_messages_url=f"{base_url}{phone_number_id}/messages" if phone_number_id else None,
+        graph_headers=MappingProxyType({
+            'Authorization': f"Bearer {values.get('whatsapp_token', '')}",
+            'Content-Type': 'application/json'
+        }),
+        version=version,
+        loaded_at=time.time()
+    )
+
+class ConfigStore:
+    """
+    Shared configuration, parsed once and swapped atomically on change.
+
+    Values come from config.json, overridden by the env file, overridden in
+    turn by the process environment, which (as with load_dotenv) always wins.
+    The env file is read directly on every reload, so edits to keys that are
+    not set in the process environment apply without a restart. A watcher thread polls
+    both files' modification times; readers just take the current snapshot,
+    which never changes once published. A file that fails to parse leaves the
+    previous snapshot in place.
+    """
+
+    def __init__(self, config_path: str = 'config.json', env_path: Optional[str] = '.env',
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, watch: bool = True):
+        """
+        Args:
+            config_path: JSON config file
+            env_path: dotenv file, or None to only use the process environment
+            poll_interval: Seconds between modification checks
+            watch: Start the watcher thread immediately
+        """
+        self.config_path = config_path
+        self.env_path = env_path
+        self.poll_interval = poll_interval
+        self._listeners: List[Callable[[ConfigSnapshot], None]] = []
+        self._reload_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stamps = self._file_stamps()
+        self._process_env = self._process_overrides()
+        self._snapshot = build_snapshot(self._read(initial=True), version=1)
+        if watch:
+            self.start()
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """The current configuration; keep a reference to use one consistent version."""
+        return self._snapshot
+
+    def subscribe(self, listener: Callable[[ConfigSnapshot], None]):
+        """Call listener with each new snapshot after a reload."""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Start the file watcher thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name='config-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the file watcher thread."""
+        self._stop_event.set()
+
+    def reload(self) -> bool:
+        """
+        Re-read the config files and publish a new snapshot.
+
+        Returns:
+            bool: True if a new snapshot was published
+        """
+        with self._reload_lock:
+            self._stamps = self._file_stamps()
+            try:
+                values = self._read()
+            except Exception as e:
+                logging.error(f"Config reload failed, keeping version {self._snapshot.version}: {e}")
+                return False
+            snapshot = build_snapshot(values, version=self._snapshot.version + 1)
+            self._snapshot = snapshot
+
+        logging.info(f"Configuration reloaded (version {snapshot.version})")
+        for listener in list(self._listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logging.error(f"Config listener failed: {e}")
+        return True
+
+    def _read(self, initial: bool = False) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        try:
+            with open(self.config_path, 'r') as f:
+                values = json.load(f)
+        except FileNotFoundError:
+            if initial:
+                logging.warning(f"Config file {self.config_path} not found. Using environment variables only.")
+        except ValueError as e:
+            if not initial:
+                raise
+            # At startup a broken file must not stop the assistant from running
+            logging.error(f"Could not parse {self.config_path}: {e}. Using environment variables only.")
+
+        env = {name: os.environ[name] for name in ENV_KEYS if os.environ.get(name)}
+        env.update({name: value for name, value in self._env_file_values().items()
+                    if name not in self._process_env})
+        for name, value in env.items():
+            values[ENV_KEYS[name]] = value
+        return values
+
+    def _env_file_values(self) -> Dict[str, str]:
+        if not (self.env_path and os.path.exists(self.env_path)):
+            return {}
+        from dotenv import dotenv_values
+        return {name: value for name, value in dotenv_values(self.env_path).items()
+                if name in ENV_KEYS and value}
+
+    def _process_overrides(self) -> Dict[str, str]:
+        """
+        Variables set by the process environment itself at startup.
+
+        load_dotenv() may already have copied the env file into os.environ, so
+        a variable only counts as a process override if its value differs from
+        the file's; the others stay hot-reloadable from the file.
+        """
+        try:
+            file_values = self._env_file_values()
+        except Exception as e:
+            logging.error(f"Could not read {self.env_path}: {e}")
+            file_values = {}
+        return {name: os.environ[name] for name in ENV_KEYS
+                if os.environ.get(name) and os.environ[name] != file_values.get(name)}
+
+    def _file_stamps(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        stamps = []
+        for path in (self.config_path, self.env_path):
+            try:
+                stat = os.stat(path) if path else None
+                stamps.append((stat.st_mtime_ns, stat.st_size) if stat else None)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            if self._file_stamps() != self._stamps:
+                self.reload()
+
+_stores: Dict[Tuple[str, Optional[str]], ConfigStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(config_path: str = 'config.json', env_path: Optional[str] = '.env') -> ConfigStore:
+    """Return the process-wide store for these files, creating it on first use."""
+    key = (os.path.abspath(config_path), os.path.abspath(env_path) if env_path else None)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ConfigStore(config_path, env_path)
+        return store
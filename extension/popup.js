@@ -22,9 +22,40 @@ const addContactBtn = document.getElementById('addContact');
 const contactsList = document.getElementById('contactsList');
 const emergencyBtn = document.getElementById('emergencyBtn');
 const statusDiv = document.getElementById('status');
+const serverUrlInput = document.getElementById('serverUrl');
+const pushTokenInput = document.getElementById('pushToken');
+const saveServerBtn = document.getElementById('saveServer');
 
-// Load contacts when popup opens
+// Load contacts and server settings when popup opens
 loadContacts();
+chrome.storage.sync.get(['serverUrl', 'pushToken'], (result) => {
+  serverUrlInput.value = result.serverUrl || '';
+  pushTokenInput.value = result.pushToken || '';
+});
+
+// Save server settings; the extension may only call the server once the user grants access
+saveServerBtn.addEventListener('click', () => {
+  const serverUrl = serverUrlInput.value.trim().replace(/\/+$/, '');
+  const pushToken = pushTokenInput.value.trim();
+  if (!serverUrl) {
+    chrome.storage.sync.set({ serverUrl: '', pushToken: '' }, () => showStatus('Location sharing disabled', 'success'));
+    return;
+  }
+  let origin;
+  try {
+    origin = new URL(serverUrl).origin;
+  } catch (e) {
+    showStatus('Please enter a valid server URL', 'error');
+    return;
+  }
+  chrome.permissions.request({ origins: [`${origin}/*`] }, (granted) => {
+    if (!granted) {
+      showStatus('Permission to contact the server was denied', 'error');
+      return;
+    }
+    chrome.storage.sync.set({ serverUrl, pushToken }, () => showStatus('Server saved', 'success'));
+  });
+});
 
 // Add contact
 addContactBtn.addEventListener('click', addContact);
@@ -152,6 +183,9 @@ function sendEmergencyAlerts() {
           const mapsUrl = `https://www.google.com/maps?q=${latitude},${longitude}`;
           const message = `🚨 EMERGENCY ALERT! 🚨\n\nI need urgent help at this location:\n${mapsUrl}\n\nPlease check on me if possible.`;
           
+          // Let the Bino server use the browser's (usually more accurate) fix
+          pushLocation(position);
+          
           // Send message to each contact
           contacts.slice(0, 10).forEach(contact => {
             sendWhatsAppMessage(contact.number, message);
@@ -184,6 +218,26 @@ function sendWhatsAppMessage(phoneNumber, message) {
   // For automatic sending, we'd need to interact with the page using a content script
 }
 
+// Push a geolocation fix to the Bino server's /location endpoint, if configured
+function pushLocation(position) {
+  chrome.storage.sync.get(['serverUrl', 'pushToken'], (result) => {
+    if (!result.serverUrl) return;
+    fetch(`${result.serverUrl}/location`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${result.pushToken || ''}`
+      },
+      body: JSON.stringify({
+        latitude: position.coords.latitude,
+        longitude: position.coords.longitude,
+        accuracy: position.coords.accuracy,
+        timestamp: position.timestamp
+      })
+    }).catch((error) => console.error('Could not share location with the Bino server:', error));
+  });
+}
+
 // Show status message
 function showStatus(message, type = 'success') {
   statusDiv.textContent = message;
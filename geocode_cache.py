@@ -0,0 +1,241 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import metrics
+
+# Default location of the reverse-geocode cache database
+GEOCODE_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.bino', 'geocode_cache.db')
+# Geohash length of a cache cell; 7 characters is roughly 150 x 150 m
+DEFAULT_PRECISION = 7
+# A cached address is reused for coordinates within this many metres of where it was looked up
+DEFAULT_MAX_DISTANCE = 150.0
+# Cells kept before the least recently used ones are evicted
+DEFAULT_CAPACITY = 5000
+# Network timeout for a reverse-geocode lookup, in seconds
+REVERSE_TIMEOUT = 3.0
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_EARTH_RADIUS = 6371000.0
+
+def geohash_encode(lat: float, lng: float, precision: int = DEFAULT_PRECISION) -> str:
+    """Encode coordinates as a geohash of the given length."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Bits alternate between longitude (even) and latitude (odd)
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            rng[0] = mid
+        else:
+            bits *= 2
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Decode a geohash to its cell as (min_lat, max_lat, min_lng, max_lng)."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+def geohash_cells_around(lat: float, lng: float, radius: float, precision: int = DEFAULT_PRECISION) -> List[str]:
+    """
+    Geohash cells that may hold points within radius metres of the coordinates.
+
+    Usually the cell itself and its eight neighbours; more towards the poles,
+    where cells become narrow.
+    """
+    min_lat, max_lat, min_lng, max_lng = geohash_bounds(geohash_encode(lat, lng, precision))
+    height, width = max_lat - min_lat, max_lng - min_lng
+    radius_lat = math.degrees(radius / _EARTH_RADIUS)
+    radius_lng = radius_lat / max(math.cos(math.radians(lat)), 0.01)
+    rows = max(1, math.ceil(radius_lat / height))
+    cols = min(max(1, math.ceil(radius_lng / width)), math.ceil(360 / width / 2))
+    center_lat, center_lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    cells = []
+    for i in range(-rows, rows + 1):
+        cell_lat = center_lat + i * height
+        if not -90 <= cell_lat <= 90:
+            continue
+        for j in range(-cols, cols + 1):
+            cell_lng = (center_lng + j * width + 180) % 360 - 180  # Wrap around the antimeridian
+            cell = geohash_encode(cell_lat, cell_lng, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * _EARTH_RADIUS * math.asin(math.sqrt(a))
+
+class GeocodeCache:
+    """
+    Persistent reverse-geocode cache keyed on geohash cells.
+
+    One row per cell holds the address and the exact coordinates it was looked
+    up for, in a WITHOUT ROWID SQLite table clustered on the geohash, so a
+    lookup reads only the handful of cells around the query. The database is
+    opened on first use and shared by every process. When it grows past its
+    capacity, the least recently used cells are evicted.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH, precision: int = DEFAULT_PRECISION,
+                 max_distance: float = DEFAULT_MAX_DISTANCE, capacity: int = DEFAULT_CAPACITY):
+        """
+        Args:
+            path: SQLite database file
+            precision: Geohash length of a cell
+            max_distance: Metres within which a cached address is reused
+            capacity: Maximum number of cached cells
+        """
+        self.path = path
+        self.precision = precision
+        self.max_distance = max_distance
+        self.capacity = capacity
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database on first use. Call with the lock held."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS places (geohash TEXT PRIMARY KEY, lat REAL NOT NULL, "
+                "lng REAL NOT NULL, address TEXT NOT NULL, used_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS places_used ON places (used_at)")
+            self._conn = conn
+        return self._conn
+
+    def nearest(self, lat: float, lng: float) -> Optional[str]:
+        """
+        Return the cached address closest to the coordinates, if within max_distance.
+
+        Returns:
+            str: The address, or None on a miss
+        """
+        cells = geohash_cells_around(lat, lng, self.max_distance, self.precision)
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f"SELECT geohash, lat, lng, address FROM places WHERE geohash IN ({','.join('?' * len(cells))})",
+                cells
+            ).fetchall()
+            best = None
+            for geohash, cached_lat, cached_lng, address in rows:
+                distance = haversine(lat, lng, cached_lat, cached_lng)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, geohash, address)
+            if best is None:
+                return None
+            conn.execute("UPDATE places SET used_at = ? WHERE geohash = ?", (time.time(), best[1]))
+            return best[2]
+
+    def put(self, lat: float, lng: float, address: str):
+        """Cache the address for the coordinates' cell, evicting old cells if full."""
+        geohash = geohash_encode(lat, lng, self.precision)
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("INSERT OR REPLACE INTO places (geohash, lat, lng, address, used_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (geohash, lat, lng, address, time.time()))
+                excess = conn.execute("SELECT COUNT(*) FROM places").fetchone()[0] - self.capacity
+                if excess > 0:
+                    conn.execute("DELETE FROM places WHERE geohash IN "
+                                 "(SELECT geohash FROM places ORDER BY used_at LIMIT ?)", (excess,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class ReverseGeocoder:
+    """Turns coordinates into an address, from the cache when a nearby place is known."""
+
+    def __init__(self, cache: Optional[GeocodeCache] = None, timeout: float = REVERSE_TIMEOUT):
+        """
+        Args:
+            cache: Geohash cache; defaults to the shared one in ~/.bino
+            timeout: Network timeout for a lookup on a cache miss
+        """
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.timeout = timeout
+
+    @metrics.timed('reverse_geocode')
+    def address_for(self, lat: float, lng: float) -> Optional[str]:
+        """
+        Get the address for coordinates.
+
+        Returns:
+            str: The address, or None if it is not cached and the lookup failed
+        """
+        try:
+            address = self.cache.nearest(lat, lng)
+        except sqlite3.Error as e:
+            logging.warning(f"Reverse-geocode cache unavailable: {e}")
+            address = None
+        if address is not None:
+            metrics.inc('bino_geocode_cache_total', result='hit')
+            return address
+        metrics.inc('bino_geocode_cache_total', result='miss')
+
+        address = self._lookup(lat, lng)
+        if address:
+            try:
+                self.cache.put(lat, lng, address)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not cache address: {e}")
+        return address
+
+    def _lookup(self, lat: float, lng: float) -> Optional[str]:
+        try:
+            # Imported lazily; geocoder pulls in a large dependency tree
+            import geocoder
+            g = geocoder.osm([lat, lng], method='reverse', timeout=self.timeout)
+            if g.ok and g.address:
+                return g.address
+        except Exception as e:
+            logging.error(f"Error reverse-geocoding {lat:.5f}, {lng:.5f}: {e}")
+        return None
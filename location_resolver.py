@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import metrics
+
+# Seconds the resolver waits for providers before answering with the best fix so far
+DEFAULT_BUDGET = 3.0
+# A fix at least this accurate (metres) ends the race early
+GOOD_ENOUGH_ACCURACY = 50.0
+# IP geolocation is only accurate to the city; reported when the provider gives no radius
+IP_ACCURACY = 5000.0
+# gpsd's default port, and the accuracy assumed when a fix carries no error estimate
+GPSD_ADDRESS = '127.0.0.1:2947'
+GPS_ACCURACY = 10.0
+# Browser-pushed coordinates older than this are ignored, in seconds
+PUSH_MAX_AGE = 120.0
+# Shared between the webhook workers that receive pushes and the assistant
+PUSHED_LOCATION_PATH = os.path.join(os.path.expanduser('~'), '.bino', 'pushed_location.json')
+# How often providers check whether the race was called off, in seconds
+POLL_INTERVAL = 0.1
+
+class LocationFix(NamedTuple):
+    """A position from one provider, with its estimated accuracy."""
+    lat: float
+    lng: float
+    accuracy: float  # 68% confidence radius in metres
+    source: str
+    timestamp: float  # time.time() when the position was measured
+    address: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The fix in the dictionary form used for alerts."""
+        return {
+            'address': self.address or f"{self.lat:.5f}, {self.lng:.5f}",
+            'maps_link': f"https://www.google.com/maps?q={self.lat},{self.lng}",
+            'lat': self.lat,
+            'lng': self.lng,
+            'accuracy': self.accuracy,
+            'source': self.source,
+            'timestamp': self.timestamp
+        }
+
+class LocationProvider(ABC):
+    """
+    A source of position fixes.
+
+    Subclasses must implement locate(), or they cannot be instantiated. It
+    runs on a resolver thread and should return promptly once the cancel
+    event is set.
+    """
+
+    name = 'provider'
+
+    @abstractmethod
+    def locate(self, cancel: threading.Event) -> Optional[LocationFix]:
+        """Return a fix, or None if this source has none."""
+
+class IPLocationProvider(LocationProvider):
+    """City-level position from IP geolocation."""
+
+    name = 'ip'
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+
+    def locate(self, cancel: threading.Event) -> Optional[LocationFix]:
+        # Imported lazily; geocoder pulls in a large dependency tree. The HTTP
+        # request itself cannot be interrupted, so a cancelled lookup runs out
+        # its timeout in the background and its result is dropped
+        import geocoder
+        g = geocoder.ip('me', timeout=self.timeout)
+        if not g.ok or g.lat is None or g.lng is None:
+            return None
+        return LocationFix(float(g.lat), float(g.lng), IP_ACCURACY, self.name, time.time(), g.address)
+
+class GpsdLocationProvider(LocationProvider):
+    """
+    Position from a gpsd-compatible daemon over its JSON socket protocol.
+
+    Connects, enables watching and returns the first TPV report with a 2D or
+    3D fix. Anything speaking the same protocol (e.g. a test stub) can stand
+    in for gpsd.
+    """
+
+    name = 'gps'
+
+    def __init__(self, address: str = GPSD_ADDRESS, connect_timeout: float = 0.5):
+        """
+        Args:
+            address: host:port of the daemon
+            connect_timeout: Seconds to wait for the connection
+        """
+        host, _, port = address.rpartition(':')
+        self.host = host or '127.0.0.1'
+        self.port = int(port)
+        self.connect_timeout = connect_timeout
+
+    def locate(self, cancel: threading.Event) -> Optional[LocationFix]:
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        except OSError as e:
+            logging.debug(f"gpsd not reachable at {self.host}:{self.port}: {e}")
+            return None
+        with sock:
+            sock.settimeout(POLL_INTERVAL)
+            sock.sendall(b'?WATCH={"enable":true,"json":true};\n')
+            buffer = b''
+            while not cancel.is_set():
+                try:
+                    chunk = sock.recv(4096)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    return None
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    fix = self._parse(line)
+                    if fix is not None:
+                        return fix
+        return None
+
+    def _parse(self, line: bytes) -> Optional[LocationFix]:
+        try:
+            report = json.loads(line)
+        except ValueError:
+            return None
+        if report.get('class') != 'TPV' or report.get('mode', 0) < 2 or 'lat' not in report or 'lon' not in report:
+            return None
+        # eph is the horizontal error estimate; older gpsd versions only report epx/epy
+        accuracy = report.get('eph') or max((report[k] for k in ('epx', 'epy') if report.get(k)),
+                                             default=GPS_ACCURACY)
+        return LocationFix(float(report['lat']), float(report['lon']), float(accuracy),
+                           self.name, time.time())
+
+class PushedLocationProvider(LocationProvider):
+    """
+    Coordinates pushed by the browser extension through the webhook server.
+
+    The last push is kept in a small JSON file so every webhook worker and the
+    assistant see it. locate() returns it if it is fresh and never waits for a
+    new one, so an idle browser does not hold the race for the whole budget.
+    """
+
+    name = 'browser'
+
+    def __init__(self, path: str = PUSHED_LOCATION_PATH, max_age: float = PUSH_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+
+    def push(self, lat: float, lng: float, accuracy: float, timestamp: Optional[float] = None) -> LocationFix:
+        """
+        Store coordinates reported by the browser.
+
+        Raises:
+            ValueError: If the coordinates or accuracy are out of range
+        """
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not accuracy > 0:
+            raise ValueError('coordinates or accuracy out of range')
+        # Never trust a timestamp from the future; the browser clock may be ahead
+        fix = LocationFix(lat, lng, accuracy, self.name, min(timestamp or time.time(), time.time()))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(fix._asdict(), f)
+        os.replace(tmp_path, self.path)
+        return fix
+
+    def latest(self) -> Optional[LocationFix]:
+        """The last pushed fix, or None if there is none or it is too old."""
+        try:
+            with open(self.path, 'r') as f:
+                fix = LocationFix(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        return fix if time.time() - fix.timestamp <= self.max_age else None
+
+    def locate(self, cancel: threading.Event) -> Optional[LocationFix]:
+        return self.latest()
+
+class LocationResolver:
+    """
+    Races several location providers and returns the most accurate fix.
+
+    All providers start at once. The resolver answers as soon as a fix is
+    good enough or every provider has finished, and at the latest when the
+    time budget runs out, with the most accurate fix received by then. Lookups
+    still outstanding are then called off.
+    """
+
+    def __init__(self, providers: Sequence[LocationProvider], budget: float = DEFAULT_BUDGET,
+                 good_enough: float = GOOD_ENOUGH_ACCURACY):
+        """
+        Args:
+            providers: Location sources to race
+            budget: Seconds to wait for fixes
+            good_enough: Accuracy in metres that ends the race early
+        """
+        self.providers = list(providers)
+        self.budget = budget
+        self.good_enough = good_enough
+        # Sized so lookups abandoned by an earlier race cannot hold up the next
+        self._executor = ThreadPoolExecutor(max_workers=max(1, 2 * len(self.providers)),
+                                            thread_name_prefix='location')
+
+    @classmethod
+    def from_env(cls, budget: float = DEFAULT_BUDGET, push_enabled: Optional[bool] = None) -> 'LocationResolver':
+        """
+        IP geolocation, gpsd at GPSD_ADDRESS (empty to disable) and browser pushes.
+
+        Args:
+            budget: Seconds to wait for fixes
+            push_enabled: Include browser-pushed coordinates; by default only
+                when LOCATION_PUSH_TOKEN is set, since pushes are refused without it
+        """
+        providers: List[LocationProvider] = [IPLocationProvider()]
+        gpsd_address = os.getenv('GPSD_ADDRESS', GPSD_ADDRESS)
+        if gpsd_address:
+            providers.append(GpsdLocationProvider(gpsd_address))
+        if push_enabled is None:
+            push_enabled = bool(os.getenv('LOCATION_PUSH_TOKEN'))
+        if push_enabled:
+            providers.append(PushedLocationProvider())
+        return cls(providers, budget)
+
+    def _run(self, provider: LocationProvider, cancel: threading.Event) -> Optional[LocationFix]:
+        start = time.perf_counter()
+        try:
+            fix = provider.locate(cancel)
+        except Exception as e:
+            logging.error(f"Location provider {provider.name} failed: {e}")
+            fix = None
+        if not cancel.is_set():
+            metrics.observe(metrics.STAGE_METRIC, time.perf_counter() - start, stage='location_provider',
+                            provider=provider.name, result='fix' if fix else 'none')
+        return fix
+
+    def resolve(self, budget: Optional[float] = None) -> Optional[LocationFix]:
+        """
+        Get the most accurate fix the providers deliver within the budget.
+
+        Returns:
+            LocationFix: The best fix, or None if no provider answered in time
+        """
+        budget = self.budget if budget is None else budget
+        deadline = time.monotonic() + budget
+        cancel = threading.Event()
+        futures = {self._executor.submit(self._run, provider, cancel): provider
+                   for provider in self.providers}
+        best: Optional[LocationFix] = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                fix = future.result()
+                if fix is not None and (best is None or fix.accuracy < best.accuracy):
+                    best = fix
+            if best is not None and best.accuracy <= self.good_enough:
+                break
+
+        cancel.set()
+        for future in pending:
+            future.cancel()
+        if pending:
+            logging.debug(f"Location race ended with {len(pending)} provider(s) outstanding: "
+                          f"{', '.join(futures[f].name for f in pending)}")
+        return best
@@ -1,30 +1,135 @@
-import geocoder
 import logging
-from typing import Optional, Dict
+import threading
+import time
+from typing import Any, Optional, Dict
+
+import metrics
+from geocode_cache import ReverseGeocoder
+from location_resolver import LocationResolver
+
+# How long a location fix is considered fresh, in seconds
+DEFAULT_TTL = 300
+# How often the background refresher fetches a new fix, in seconds
+DEFAULT_REFRESH_INTERVAL = 120
 
 class LocationService:
-    @staticmethod
-    def get_current_location() -> Optional[Dict[str, str]]:
+    def __init__(self, ttl: float = DEFAULT_TTL, refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 auto_refresh: bool = True, resolver: Optional[LocationResolver] = None,
+                 reverse_geocoder: Optional[ReverseGeocoder] = None):
         """
-        Get the current location using IP-based geolocation.
-        Returns a dictionary with 'address' and 'maps_link' or None if failed.
+        Args:
+            ttl: Maximum age in seconds before a cached fix is refreshed synchronously
+            refresh_interval: Seconds between background refreshes
+            auto_refresh: Start the background refresher thread immediately
+            resolver: Location providers to race; defaults to IP geolocation,
+                gpsd and browser-pushed coordinates
+            reverse_geocoder: Finds addresses for GPS and browser fixes, which
+                only carry coordinates; cached per geohash cell on disk
         """
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.resolver = resolver or LocationResolver.from_env()
+        self.reverse_geocoder = reverse_geocoder or ReverseGeocoder()
+        self._cached: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        # Serialises lookups so concurrent callers share one network request
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if auto_refresh:
+            self.start()
+
+    def start(self):
+        """Start the background refresher thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name='location-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresher thread."""
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.refresh_interval)
+
+    @metrics.timed('location_lookup')
+    def _lookup(self) -> Optional[Dict[str, Any]]:
+        """Race the location providers and return the most accurate fix within the budget."""
         try:
-            g = geocoder.ip('me')
-            if g.ok:
-                return {
-                    'address': g.address,
-                    'maps_link': f"https://www.google.com/maps?q={g.lat},{g.lng}"
-                }
+            fix = self.resolver.resolve()
+            if fix:
+                if fix.address is None:
+                    fix = fix._replace(address=self.reverse_geocoder.address_for(fix.lat, fix.lng))
+                logging.info(f"Location fix from {fix.source} (±{fix.accuracy:.0f} m)")
+                return fix.to_dict()
         except Exception as e:
             logging.error(f"Error getting location: {e}")
         return None
 
+    def refresh(self, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a new location fix and update the cache.
+        If max_age is given and another caller refreshed the cache within that many
+        seconds while we waited, the cached fix is reused instead of a new lookup.
+        Returns the new location, or None if the lookup failed.
+        """
+        with self._refresh_lock:
+            if max_age is not None:
+                cached = self.get_cached_location()
+                if cached and cached['age'] <= max_age:
+                    return cached
+            location = self._lookup()
+            if location:
+                # A pushed fix may already be some seconds old when it is picked up
+                measured_ago = max(0.0, time.time() - location.get('timestamp', time.time()))
+                with self._lock:
+                    self._cached = location
+                    self._fetched_at = time.monotonic() - measured_ago
+            return location
+
+    def get_cached_location(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the last known location without any network access.
+        The result includes 'age' (seconds since the fix was taken), or None if
+        no fix has been taken yet.
+        """
+        with self._lock:
+            if self._cached is None:
+                return None
+            return dict(self._cached, age=round(time.monotonic() - self._fetched_at, 1))
+
+    def get_current_location(self, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the current location, preferring the cached fix.
+        Returns a dictionary with 'address', 'maps_link', 'accuracy' (metres), 'source'
+        and 'age' or None if failed.
+        A lookup is only performed when there is no cached fix or it is older than max_age
+        (the TTL by default); if that lookup fails, the stale fix is returned rather than nothing.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with metrics.timed('location'):
+            cached = self.get_cached_location()
+            if cached and cached['age'] <= max_age:
+                metrics.inc('bino_location_requests_total', source='cache')
+                return cached
+
+            if self.refresh(max_age=max_age):
+                metrics.inc('bino_location_requests_total', source='lookup')
+                return self.get_cached_location()
+            metrics.inc('bino_location_requests_total', source='stale' if cached else 'none')
+            return cached
+
 if __name__ == "__main__":
     # Test the location service
-    location = LocationService.get_current_location()
+    location = LocationService(auto_refresh=False).get_current_location()
     if location:
         print(f"Current Location: {location['address']}")
         print(f"Google Maps: {location['maps_link']}")
+        print(f"Accuracy: ±{location['accuracy']:.0f} m ({location['source']})")
     else:
         print("Could not determine location.")
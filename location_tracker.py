@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import metrics
+from geocode_cache import haversine
+from whatsapp_sender import PRIORITY_CONFIRMATION
+
+# An update is sent when the position moves further than this, in metres
+DEFAULT_MIN_DISTANCE = 50.0
+# ...or when no update was sent for this long, in seconds
+DEFAULT_MAX_INTERVAL = 300.0
+# How long tracking continues after the last alert, in seconds
+DEFAULT_DURATION = 1800.0
+# Poll interval bounds: fastest while moving, backing off to the slowest while still
+MIN_POLL_INTERVAL = 15.0
+MAX_POLL_INTERVAL = 120.0
+
+class LocationTracker:
+    """
+    Streams location updates to contacts for a while after an alert.
+
+    A worker polls the location service, quickly while the position changes
+    and backing off while it stays put. An update goes out only when the
+    position moved more than min_distance (or the fix's own inaccuracy, so
+    IP-geolocation jitter does not count as movement) or max_interval passed
+    since the last one. Each update is one message fanned out to every
+    contact in a single batch.
+    """
+
+    def __init__(self, location_service, sender, min_distance: float = DEFAULT_MIN_DISTANCE,
+                 max_interval: float = DEFAULT_MAX_INTERVAL, duration: float = DEFAULT_DURATION,
+                 min_poll: float = MIN_POLL_INTERVAL, max_poll: float = MAX_POLL_INTERVAL):
+        """
+        Args:
+            location_service: Source of fixes (LocationService)
+            sender: WhatsAppSender used for the batched updates
+            min_distance: Metres of movement that trigger an update
+            max_interval: Seconds after which an update is sent even without movement
+            duration: Seconds to keep tracking after the last call to track(); 0 disables tracking
+            min_poll: Poll interval while moving, in seconds
+            max_poll: Longest poll interval while stationary, in seconds
+        """
+        self.location_service = location_service
+        self.sender = sender
+        self.min_distance = min_distance
+        self.max_interval = max_interval
+        self.duration = duration
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self._recipients: List[str] = []
+        self._deadline = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def track(self, recipients: Iterable[str], last_location: Optional[Dict[str, Any]] = None):
+        """
+        Start tracking, or add recipients to and extend the current session.
+
+        Args:
+            recipients: Contacts that received the alert
+            last_location: The location already sent in the alert, so the first
+                update is only sent once the position changes
+        """
+        if self.duration <= 0:
+            return
+        with self._lock:
+            for recipient in recipients:
+                if recipient not in self._recipients:
+                    self._recipients.append(recipient)
+            self._deadline = time.monotonic() + self.duration
+            if not self._recipients or self._thread is not None:
+                return
+            # Each session gets its own event, so a stopped worker that is still
+            # finishing a poll cannot be revived by a new session
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop_event, last_location),
+                                            name='location-tracker', daemon=True)
+            self._thread.start()
+        logging.info(f"Live location tracking started for {len(self._recipients)} contact(s)")
+
+    def stop(self):
+        """Stop tracking and forget the recipients."""
+        with self._lock:
+            self._stop_event.set()
+            self._thread = None
+            self._recipients = []
+
+    def _poll(self, max_age: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self.location_service.get_current_location(max_age=max_age)
+        except Exception as e:
+            logging.error(f"Location tracking poll failed: {e}")
+            return None
+
+    def _run(self, stop_event: threading.Event, last_sent: Optional[Dict[str, Any]]):
+        last_sent_at = time.monotonic()
+        previous = last_sent
+        interval = self.min_poll
+        while not stop_event.wait(interval):
+            # Checked under the lock so a concurrent track() either extends this
+            # session or, once it has ended, starts a new one
+            with self._lock:
+                if time.monotonic() >= self._deadline:
+                    self._thread = None
+                    self._recipients = []
+                    break
+            location = self._poll(max_age=interval / 2)
+            if not location or location.get('lat') is None:
+                interval = min(interval * 2, self.max_poll)
+                continue
+
+            # Poll fast while the position keeps changing, back off while it does not
+            if previous and previous.get('lat') is not None and \
+                    haversine(previous['lat'], previous['lng'], location['lat'], location['lng']) >= self.min_distance:
+                interval = self.min_poll
+            else:
+                interval = min(interval * 2, self.max_poll)
+            previous = location
+
+            moved = None
+            if last_sent and last_sent.get('lat') is not None:
+                moved = haversine(last_sent['lat'], last_sent['lng'], location['lat'], location['lng'])
+            threshold = max(self.min_distance, location.get('accuracy') or 0)
+            if moved is None or moved >= threshold:
+                reason = 'moved'
+            elif time.monotonic() - last_sent_at >= self.max_interval:
+                reason = 'interval'
+            else:
+                metrics.inc('bino_tracking_updates_total', result='suppressed')
+                continue
+
+            with self._lock:
+                if stop_event.is_set():
+                    break
+                recipients = list(self._recipients)
+            self.sender.send_bulk(recipients, self._format_update(location, moved),
+                                  priority=PRIORITY_CONFIRMATION)
+            metrics.inc('bino_tracking_updates_total', result=reason)
+            last_sent, last_sent_at = location, time.monotonic()
+
+        logging.info("Live location tracking stopped")
+
+    @staticmethod
+    def _format_update(location: Dict[str, Any], moved: Optional[float]) -> str:
+        """A short update message; it goes to every contact, possibly many times."""
+        lines = [f"📍 *Location update* ({datetime.now().strftime('%H:%M:%S')})",
+                 location.get('address', 'Unknown location'),
+                 f"🗺️ {location.get('maps_link')}"]
+        if moved is not None:
+            lines.append(f"Moved {moved:.0f} m since the last update")
+        return '\n'.join(lines)
@@ -1,14 +1,22 @@
-import os
+import time
+
+# Taken before anything else is imported so the startup report covers imports
+_PROCESS_START = time.perf_counter()
+
 import sys
 import logging
-import json
+import threading
 import traceback
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple
 from pathlib import Path
 
 from dotenv import load_dotenv
 from colorama import init, Fore, Style, just_fix_windows_console
 
+import metrics
+from config_store import ConfigSnapshot, ConfigStore, get_store
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -32,29 +40,104 @@ logging.basicConfig(
     ]
 )
 
-# Import after environment is loaded
-from speech_handler import SpeechHandler
-from location_service import LocationService
-from whatsapp_sender import WhatsAppSender
+class StartupProfiler:
+    """Records how long each startup step takes."""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.stages: List[Tuple[str, float]] = [('imports', time.perf_counter() - start)]
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as a named startup step."""
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - stage_start))
+
+    def add(self, name: str, seconds: float):
+        self.stages.append((name, seconds))
+
+    def report(self) -> str:
+        """Format the startup breakdown in milliseconds."""
+        total = time.perf_counter() - self.start
+        parts = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.stages)
+        return f"Startup took {total * 1000:.0f}ms ({parts})"
 
 class BinoEmergencyAssistant:
-    def __init__(self, config_path: str = 'config.json'):
+    def __init__(self, config_path: str = 'config.json', list_devices: bool = False):
         """Initialize the Bino Emergency Assistant."""
+        self.profiler = StartupProfiler(_PROCESS_START)
         self.config_path = config_path
-        self.config = self._load_config(config_path)
+        with self.profiler.stage('config'):
+            self.config_store = self._load_config(config_path)
         
         # Initialize services with error handling
         try:
-            self.location_service = LocationService()
-            self.whatsapp_sender = WhatsAppSender(config_path)
+            # Service modules are imported here, after the environment is loaded,
+            # so their cost shows up in the startup report
+            with self.profiler.stage('location_service'):
+                from location_resolver import DEFAULT_BUDGET, LocationResolver
+                from location_service import LocationService
+                # Keeps a fresh location fix ready in the background, racing IP
+                # geolocation, gpsd and browser-pushed coordinates
+                self.location_service = LocationService(
+                    ttl=float(self.config.get('location_ttl', 300)),
+                    resolver=LocationResolver.from_env(
+                        float(self.config.get('location_budget', DEFAULT_BUDGET)),
+                        push_enabled=bool(self.config.get('location_push_token'))
+                    )
+                )
+
+            with self.profiler.stage('whatsapp_sender'):
+                from whatsapp_sender import WhatsAppSender
+                self.whatsapp_sender = WhatsAppSender(config_store=self.config_store)
+                # Open the Graph API connection now so the first alert skips the handshake
+                threading.Thread(target=self.whatsapp_sender.warm_up, daemon=True).start()
+                # Alerts go out over the Graph API, hedged with the WhatsApp Web
+                # daemon (if whatsapp_daemon_url is set) when confirmation is slow
+                from transports import (DEFAULT_DELIVERY_TIMEOUT, DEFAULT_HEDGE_DELAY, GraphTransport,
+                                        HedgedDelivery, WhatsAppWebTransport)
+                from whatsapp_web_client import WhatsAppWebClient
+                self.whatsapp_web = WhatsAppWebClient(config_store=self.config_store)
+                self.delivery = HedgedDelivery(
+                    [GraphTransport(self.whatsapp_sender), WhatsAppWebTransport(self.whatsapp_web)],
+                    hedge_delay=float(self.config.get('hedge_delay', DEFAULT_HEDGE_DELAY)),
+                    timeout=float(self.config.get('delivery_timeout', DEFAULT_DELIVERY_TIMEOUT))
+                )
+                # Keeps contacts posted on where the user goes after an alert
+                from location_tracker import (DEFAULT_DURATION, DEFAULT_MAX_INTERVAL, DEFAULT_MIN_DISTANCE,
+                                              LocationTracker)
+                self.location_tracker = LocationTracker(
+                    self.location_service, self.whatsapp_sender,
+                    min_distance=float(self.config.get('tracking_min_distance', DEFAULT_MIN_DISTANCE)),
+                    max_interval=float(self.config.get('tracking_max_interval', DEFAULT_MAX_INTERVAL)),
+                    duration=float(self.config.get('tracking_duration', DEFAULT_DURATION))
+                )
             
             # Initialize speech handler with wake word and emergency phrases
-            self.speech_handler = SpeechHandler(
-                wake_word="bino",
-                emergency_phrases=["i'm in danger", "help me", "emergency", "i need help"]
+            with self.profiler.stage('speech_handler'):
+                from speech_handler import SpeechHandler
+                self.speech_handler = SpeechHandler(
+                    wake_word="bino",
+                    emergency_phrases=["i'm in danger", "help me", "emergency", "i need help"],
+                    list_devices=list_devices
+                )
+            for name, seconds in self.speech_handler.startup_times.items():
+                self.profiler.add(f"speech_handler.{name}", seconds)
+
+            # Log per-stage latency periodically, and optionally write it in
+            # Prometheus text format for a textfile collector
+            self.metrics_dumper = metrics.MetricsDumper(
+                metrics.REGISTRY,
+                interval=float(self.config.get('metrics_interval', metrics.DEFAULT_DUMP_INTERVAL)),
+                path=self.config.get('metrics_path')
             )
+            self.metrics_dumper.start()
             
             self._show_welcome_message()
+            logging.info(self.profiler.report())
             
         except Exception as e:
             print(f"\n{Fore.RED}Error initializing Bino Emergency Assistant: {e}\n")
@@ -77,37 +160,25 @@ class BinoEmergencyAssistant:
         print("4. Speak clearly when prompted")
         print("\n" + Fore.GREEN + "System ready. Say 'Bino' to start." + Style.RESET_ALL)
     
-    def _load_config(self, config_path: str) -> dict:
+    @property
+    def config(self) -> ConfigSnapshot:
+        """The current configuration snapshot."""
+        return self.config_store.snapshot
+
+    def _load_config(self, config_path: str) -> ConfigStore:
         """
         Load configuration from both JSON file and environment variables.
         Environment variables take precedence over the config file.
-        """
-        config = {}
-        
-        # First, load from config file if it exists
-        try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-        except Exception as e:
-            logging.warning(f"Could not load config file: {e}. Using environment variables only.")
         
-        # Then override with environment variables if they exist
-        env_config = {
-            'trusted_contact': os.getenv('TRUSTED_CONTACT'),
-            'user_name': os.getenv('USER_NAME', 'User'),
-            'emergency_message': os.getenv('EMERGENCY_MESSAGE', '🚨 I need help!'),
-            'whatsapp_token': os.getenv('WHATSAPP_TOKEN'),
-            'whatsapp_phone_number_id': os.getenv('WHATSAPP_PHONE_NUMBER_ID')
-        }
-        
-        # Update config with environment variables, skipping None values
-        for key, value in env_config.items():
-            if value is not None:
-                config[key] = value
+        The store watches config.json and .env, so edits (e.g. a new trusted
+        contact) apply without restarting and recalibrating the microphone.
+        """
+        store = get_store(config_path)
+        store.subscribe(self._on_config_reload)
+        config = store.snapshot
         
         # Validate required fields
-        required_fields = ['trusted_contact', 'whatsapp_token', 'whatsapp_phone_number_id']
-        missing_fields = [field for field in required_fields if not config.get(field)]
+        missing_fields = self._missing_fields(config)
         
         if missing_fields:
             logging.error(f"Missing required configuration: {', '.join(missing_fields)}")
@@ -120,8 +191,23 @@ class BinoEmergencyAssistant:
                 print(f"See {Fore.CYAN}.env.example{Style.RESET_ALL} for an example configuration.")
                 sys.exit(1)
         
-        return config
+        return store
+
+    @staticmethod
+    def _missing_fields(config: ConfigSnapshot) -> List[str]:
+        missing_fields = [] if config.contacts else ['trusted_contact']
+        return missing_fields + [field for field in ('whatsapp_token', 'whatsapp_phone_number_id')
+                                 if not config.get(field)]
+
+    def _on_config_reload(self, config: ConfigSnapshot):
+        """Report the new configuration after config.json or .env was edited."""
+        missing_fields = self._missing_fields(config)
+        if missing_fields:
+            logging.error(f"Reloaded configuration is missing: {', '.join(missing_fields)}")
+        print(f"\n{Fore.CYAN}Configuration reloaded: {len(config.contacts)} trusted "
+              f"contact(s).{Style.RESET_ALL}")
     
+    @metrics.timed('emergency')
     def handle_emergency(self):
         """Handle emergency situation by getting location and sending alert."""
         print(Fore.RED + "\nEMERGENCY DETECTED!" + Style.RESET_ALL)
@@ -134,14 +220,25 @@ class BinoEmergencyAssistant:
             print(f"\n{Fore.GREEN}Location found!{Style.RESET_ALL}")
             print(f"Address: {location.get('address')}")
             print(f"Map: {location.get('maps_link')}")
+            if location.get('accuracy'):
+                print(f"Accuracy: ±{location['accuracy']:.0f} m ({location.get('source')})")
+            print(f"Location fix age: {location.get('age', 0):.0f}s")
             
             # Send alert via WhatsApp
             print("\nSending emergency alert...")
-            if self.whatsapp_sender.send_emergency_alert(location):
-                print(Fore.GREEN + "Alert sent successfully!" + Style.RESET_ALL)
+            message = self.whatsapp_sender.format_emergency_alert(location)
+            delivered = self.delivery.deliver(self.config.contacts, message)
+            if any(delivered.values()):
+                metrics.inc('bino_alerts_total', source='voice', result='sent')
+                via = ', '.join(sorted({name for name in delivered.values() if name}))
+                print(Fore.GREEN + f"Alert sent successfully! (via {via})" + Style.RESET_ALL)
+                self.location_tracker.track([contact for contact, transport in delivered.items() if transport],
+                                            location)
             else:
+                metrics.inc('bino_alerts_total', source='voice', result='failed')
                 print(Fore.RED + "Failed to send alert. Please check your internet connection." + Style.RESET_ALL)
         else:
+            metrics.inc('bino_alerts_total', source='voice', result='no_location')
             print(Fore.RED + "Could not determine your location. Please check your internet connection." + Style.RESET_ALL)
     
     def start(self):
@@ -153,10 +250,13 @@ class BinoEmergencyAssistant:
         except Exception as e:
             print(Fore.RED + f"\nAn error occurred: {e}" + Style.RESET_ALL)
             logging.error(f"Error in main loop: {e}")
+        finally:
+            self.location_tracker.stop()
+            self.metrics_dumper.stop()
 
 if __name__ == "__main__":
     try:
-        assistant = BinoEmergencyAssistant()
+        assistant = BinoEmergencyAssistant(list_devices='--list-devices' in sys.argv)
         assistant.start()
     except Exception as e:
         print(Fore.RED + f"\nFatal error: {e}" + Style.RESET_ALL)
@@ -0,0 +1,218 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets, from 1 ms to 30 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds between periodic metric dumps in the CLI assistant
+DEFAULT_DUMP_INTERVAL = 60
+
+STAGE_METRIC = 'bino_stage_duration_seconds'
+STAGE_ERRORS_METRIC = 'bino_stage_errors_total'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+class Histogram:
+    """Fixed-bucket histogram. Not thread-safe; the registry holds the lock."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower  # Beyond the largest bucket
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and latency histograms, rendered in Prometheus text format.
+
+    Recording is a dictionary lookup and a bisect under one lock, cheap enough
+    to wrap every stage of the emergency path. Metrics are per process; with
+    several server workers each one reports its own.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {
+            STAGE_METRIC: 'Time spent in each stage of the emergency path',
+            STAGE_ERRORS_METRIC: 'Stage executions that raised an exception',
+            'bino_detections_total': 'Wake word and emergency detections by match type',
+            'bino_alerts_total': 'Emergency alerts by source and outcome',
+            'bino_location_requests_total': 'Location requests by where the fix came from',
+            'bino_location_pushes_total': 'Browser geolocation fixes pushed to the webhook server',
+            'bino_messages_total': 'WhatsApp messages by transport and final outcome',
+            'bino_graph_responses_total': 'Graph API responses by HTTP status, including retried attempts',
+            'bino_delivery_wins_total': 'Hedged deliveries by the transport that confirmed first',
+            'bino_duplicate_deliveries_total': 'Messages also delivered by a slower transport after another one won',
+            'bino_tracking_updates_total': 'Live location polls by whether an update was sent (moved, interval) or suppressed',
+        }
+
+    def describe(self, name: str, help_text: str):
+        """Set the HELP text shown for a metric."""
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increment a counter."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value, in seconds for latencies, in a histogram."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timed(self, stage: str, **labels):
+        """
+        Time the enclosed block as a stage of the emergency path.
+
+        Exceptions are counted in bino_stage_errors_total and re-raised.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(STAGE_ERRORS_METRIC, stage=stage, **labels)
+            raise
+        finally:
+            self.observe(STAGE_METRIC, time.perf_counter() - start, stage=stage, **labels)
+
+    def stage_summary(self) -> List[Tuple[str, int, Optional[float], Optional[float]]]:
+        """(stage, count, p50, p95) for every stage histogram, in seconds; other labels in brackets."""
+        with self._lock:
+            series = dict(self._histograms.get(STAGE_METRIC, {}))
+            summary = []
+            for key, h in sorted(series.items()):
+                labels = dict(key)
+                name = labels.pop('stage', '')
+                if labels:
+                    name += f"[{','.join(labels.values())}]"
+                summary.append((name, h.count, h.quantile(0.5), h.quantile(0.95)))
+            return summary
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(self.buckets, histogram.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+class MetricsDumper:
+    """
+    Periodically logs a per-stage latency summary.
+
+    If a path is given, the full Prometheus text is also written there, e.g.
+    for the node_exporter textfile collector.
+    """
+
+    def __init__(self, registry: MetricsRegistry, interval: float = DEFAULT_DUMP_INTERVAL,
+                 path: Optional[str] = None):
+        self.registry = registry
+        self.interval = interval
+        self.path = path
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-dump', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the dump thread after a final dump."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def dump(self):
+        summary = self.registry.stage_summary()
+        if summary:
+            parts = ', '.join(f"{stage} n={count} p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms"
+                              for stage, count, p50, p95 in summary)
+            logging.info(f"Stage latency: {parts}")
+        if self.path:
+            try:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(self.registry.render())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {self.path}: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.dump()
+        self.dump()
+
+# Process-wide registry used by all modules
+REGISTRY = MetricsRegistry()
+timed = REGISTRY.timed
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+render = REGISTRY.render
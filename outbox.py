@@ -0,0 +1,277 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Default location of the outbox database
+OUTBOX_PATH = os.path.join(os.path.expanduser('~'), '.bino', 'outbox.db')
+# Undelivered messages older than this are given up on rather than sent late, in seconds
+OUTBOX_MAX_AGE = 900.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+class Outbox:
+    """
+    Durable SQLite (WAL mode) outbox for messages that must not be lost.
+
+    Messages are written before they are sent and claimed by the writer with
+    a lease, so the caller can send them straight away. Results are recorded
+    asynchronously and committed in batches by a delivery worker, which also
+    retries failed messages with backoff and picks up messages whose lease
+    expired, e.g. because the process crashed mid-send. Delivery is
+    at-least-once, within max_age: a message still undelivered by then (an
+    alert left over from before a long outage, say) is marked as failed
+    instead of being sent as if it were current.
+    """
+
+    def __init__(self, send_func: Callable[[str, str], bool], path: str = OUTBOX_PATH,
+                 max_attempts: int = 10, lease: float = 30.0, poll_interval: float = 1.0,
+                 max_age: float = OUTBOX_MAX_AGE):
+        """
+        Args:
+            send_func: Delivers one message, called as send_func(recipient, body)
+            path: SQLite database file
+            max_attempts: Attempts before a message is marked as failed
+            lease: Seconds a claimed message is reserved for its sender before
+                the worker may retry it; must exceed the longest a send can take
+            poll_interval: Seconds between checks for due messages
+            max_age: Seconds after creation when an undelivered message is given up on
+        """
+        self.send_func = send_func
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL only syncs at checkpoints: commits survive a process
+        # crash and cost microseconds instead of an fsync each
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        self._completions: List[Tuple[int, bool, Optional[str]]] = []
+        self._completions_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the delivery worker."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='outbox-delivery', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the delivery worker after committing pending results."""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._flush_completions()
+
+    def add(self, recipients: Sequence[str], body: str) -> List[int]:
+        """
+        Durably record messages, claimed for immediate sending by the caller.
+
+        All recipients are written in one transaction. A caller that queues
+        the sends should renew() each one when it actually starts, so time
+        spent queued does not eat into the lease. The caller must report each
+        outcome with complete(); unreported messages are retried by the worker
+        once their lease expires.
+
+        Returns:
+            List[int]: Outbox IDs, in the same order as recipients
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                ids = [
+                    self._conn.execute(
+                        "INSERT INTO outbox (recipient, body, status, attempts, next_attempt_at, lease_until, created_at) "
+                        "VALUES (?, ?, 'sending', 1, ?, ?, ?)",
+                        (recipient, body, now, now + self.lease, now)
+                    ).lastrowid
+                    for recipient in recipients
+                ]
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return ids
+
+    def complete(self, message_id: int, ok: bool, error: Optional[str] = None):
+        """Report the outcome of a send; committed in a batch by the worker."""
+        with self._completions_lock:
+            self._completions.append((message_id, ok, error))
+        self._wakeup.set()
+
+    def renew(self, message_id: int, attempt: int = 1) -> bool:
+        """
+        Extend a claimed message's lease by a full lease period, just before sending it.
+
+        Args:
+            message_id: Outbox ID
+            attempt: The attempt the caller claimed; 1 for messages from add()
+
+        Returns:
+            bool: False if the message must not be sent: it was delivered
+            elsewhere, expired, or its lease ran out and the worker claimed it
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE outbox SET lease_until = ? WHERE id = ? AND status = 'sending' AND attempts = ?",
+                (time.time() + self.lease, message_id, attempt)
+            ).rowcount > 0
+
+    def mark_sent(self, recipient: str, body: str) -> int:
+        """
+        Record that a message was delivered by other means, so it is not retried.
+
+        A send of it that is still in flight may still deliver it once more,
+        but its failure no longer schedules a retry.
+
+        Returns:
+            int: Number of outbox messages marked as sent
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE outbox SET status = 'sent', last_error = NULL "
+                "WHERE recipient = ? AND body = ? AND status IN ('pending', 'sending')",
+                (recipient, body)
+            ).rowcount
+
+    def pending_count(self) -> int:
+        """Number of messages not yet delivered or given up on."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+
+    def _retry_delay(self, attempts: int) -> float:
+        return random.uniform(0.5, 1.0) * min(300.0, 2.0 ** attempts)
+
+    def _flush_completions(self):
+        with self._completions_lock:
+            completions, self._completions = self._completions, []
+        if not completions:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for message_id, ok, error in completions:
+                    if ok:
+                        self._conn.execute("UPDATE outbox SET status = 'sent', last_error = NULL WHERE id = ?",
+                                           (message_id,))
+                        continue
+                    row = self._conn.execute("SELECT attempts FROM outbox WHERE id = ?", (message_id,)).fetchone()
+                    if row is None:
+                        continue
+                    attempts = row[0]
+                    if attempts >= self.max_attempts:
+                        logging.error(f"Giving up on outbox message {message_id} after {attempts} attempts")
+                        status, next_attempt_at = 'failed', now
+                    else:
+                        status, next_attempt_at = 'pending', now + self._retry_delay(attempts)
+                    # A message marked as sent by mark_sent() stays sent
+                    self._conn.execute(
+                        "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ? "
+                        "WHERE id = ? AND status != 'sent'",
+                        (status, next_attempt_at, error, message_id)
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _claim_due(self, limit: int = 50) -> List[Tuple[int, str, str, int]]:
+        """Claim messages that are due for a retry or whose lease expired, expiring stale ones."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Sends still in flight keep their lease and finish normally
+                expired = self._conn.execute(
+                    "UPDATE outbox SET status = 'failed', last_error = 'expired' "
+                    "WHERE created_at < ? AND (status = 'pending' OR (status = 'sending' AND lease_until <= ?))",
+                    (now - self.max_age, now)
+                ).rowcount
+                if expired:
+                    logging.warning(f"Dropped {expired} outbox message(s) older than {self.max_age:.0f}s")
+                rows = self._conn.execute(
+                    "SELECT id, recipient, body, attempts + 1 FROM outbox "
+                    "WHERE (status = 'pending' AND next_attempt_at <= ?) "
+                    "OR (status = 'sending' AND lease_until <= ?) "
+                    "ORDER BY id LIMIT ?",
+                    (now, now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET status = 'sending', attempts = attempts + 1, lease_until = ? WHERE id = ?",
+                    [(now + self.lease, row[0]) for row in rows]
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return rows
+
+    def _purge_sent(self, older_than: float = 24 * 3600):
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE status = 'sent' AND created_at < ?",
+                               (time.time() - older_than,))
+
+    def _run(self):
+        last_purge = 0.0
+        while not self._stop_event.is_set():
+            try:
+                self._flush_completions()
+                for message_id, recipient, body, attempt in self._claim_due():
+                    if self._stop_event.is_set():
+                        break
+                    # Claimed rows are sent one after another; restart the lease
+                    # so it covers this send rather than the ones before it
+                    if not self.renew(message_id, attempt):
+                        continue
+                    try:
+                        ok = bool(self.send_func(recipient, body))
+                        error = None if ok else 'send failed'
+                    except Exception as e:
+                        ok, error = False, str(e)
+                    if ok:
+                        logging.info(f"Outbox message {message_id} delivered to {recipient}")
+                    self.complete(message_id, ok, error)
+                self._flush_completions()
+                if time.monotonic() - last_purge > 3600:
+                    self._purge_sent()
+                    last_purge = time.monotonic()
+            except sqlite3.Error as e:
+                logging.error(f"Outbox delivery error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
@@ -0,0 +1,175 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Soundex digit for each consonant; vowels and h/w/y are dropped
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'), 'l': '4', **dict.fromkeys('mn', '5'), 'r': '6'
+}
+
+class PhraseMatch(NamedTuple):
+    phrase: str
+    transcript: str
+    kind: str  # 'exact', 'phonetic' or 'fuzzy'
+    distance: int = 0
+
+def normalize(text: str) -> str:
+    """Lowercase, drop apostrophes and collapse everything else to single spaces."""
+    return _NON_ALNUM.sub(' ', text.lower().replace("'", '')).strip()
+
+def soundex(word: str) -> str:
+    """Four-character Soundex code of a word."""
+    if not word:
+        return ''
+    code = word[0]
+    last = _SOUNDEX_CODES.get(word[0], '')
+    for ch in word[1:]:
+        digit = _SOUNDEX_CODES.get(ch, '')
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in 'hw':
+            last = digit
+    return code.ljust(4, '0')
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up early once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class PhraseMatcher:
+    """
+    Matches a set of phrases against recognizer transcripts.
+
+    All phrases are compiled into one Aho-Corasick automaton, so an exact
+    whole-word search costs a single pass over the transcript however many
+    phrases are configured. Transcripts with no exact hit fall back to a
+    phonetic (Soundex) comparison and then a bounded edit-distance comparison
+    over word windows of the same length as each phrase.
+    """
+
+    def __init__(self, phrases: Iterable[str], max_edit_ratio: float = 0.2, min_fuzzy_length: int = 4):
+        """
+        Args:
+            phrases: Phrases to detect
+            max_edit_ratio: Allowed edits per character for fuzzy matches
+            min_fuzzy_length: Phrases shorter than this only match exactly
+        """
+        self.phrases = [p for p in dict.fromkeys(normalize(p) for p in phrases) if p]
+        self.max_edit_ratio = max_edit_ratio
+        self.min_fuzzy_length = min_fuzzy_length
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for phrase in self.phrases:
+            # Pad with spaces so only whole words match
+            self._add_pattern(f" {phrase} ", phrase)
+        self._build_failure_links()
+
+        # Phonetic keys and word counts for the fallback passes
+        self._phonetic: Dict[Tuple[str, ...], str] = {}
+        self._by_length: Dict[int, List[str]] = {}
+        for phrase in self.phrases:
+            words = phrase.split()
+            self._phonetic.setdefault(tuple(soundex(w) for w in words), phrase)
+            self._by_length.setdefault(len(words), []).append(phrase)
+
+    def _add_pattern(self, pattern: str, phrase: str):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append(phrase)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_exact(self, text: str) -> Optional[str]:
+        """Return the first phrase occurring as whole words in text, if any."""
+        state = 0
+        for ch in f" {normalize(text)} ":
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if self._output[state]:
+                return self._output[state][0]
+        return None
+
+    def find_approximate(self, text: str) -> Optional[PhraseMatch]:
+        """Return a phonetic or edit-distance match of any phrase in text, if any."""
+        words = normalize(text).split()
+        best = None
+        for length, phrases in self._by_length.items():
+            for start in range(len(words) - length + 1):
+                window = words[start:start + length]
+                phrase = self._phonetic.get(tuple(soundex(w) for w in window))
+                if phrase and len(phrase) >= self.min_fuzzy_length:
+                    return PhraseMatch(phrase, text, 'phonetic')
+
+                candidate = ' '.join(window)
+                for phrase in phrases:
+                    if len(phrase) < self.min_fuzzy_length:
+                        continue
+                    limit = max(1, int(len(phrase) * self.max_edit_ratio))
+                    distance = edit_distance(candidate, phrase, limit)
+                    if distance <= limit and (best is None or distance < best.distance):
+                        best = PhraseMatch(phrase, text, 'fuzzy', distance)
+        return best
+
+    def match(self, hypotheses: Iterable[str]) -> Optional[PhraseMatch]:
+        """
+        Match phrases against every recognizer alternative.
+
+        Exact matches in any alternative win over approximate ones, so a
+        lower-ranked alternative with the exact phrase beats a near miss in
+        the top transcript.
+
+        Args:
+            hypotheses: Transcripts, best first
+
+        Returns:
+            PhraseMatch: The match found, or None
+        """
+        hypotheses = list(hypotheses)
+        for text in hypotheses:
+            phrase = self.find_exact(text)
+            if phrase:
+                return PhraseMatch(phrase, text, 'exact')
+
+        best = None
+        for text in hypotheses:
+            found = self.find_approximate(text)
+            if found and found.kind == 'phonetic':
+                return found
+            if found and (best is None or found.distance < best.distance):
+                best = found
+        return best
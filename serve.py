@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Load environment variables before the workers import webhook.py
+load_dotenv()
+
+def serve_production():
+    """
+    Serve the webhook with several worker processes.
+
+    Uses gunicorn (threaded workers) where available. Worker processes share
+    sessions, recent contacts and message deduplication through the SQLite
+    state backend. On platforms without gunicorn (Windows) it falls back to a
+    single-process waitress server.
+    """
+    port = int(os.getenv('PORT', 5000))
+    workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+    threads = int(os.getenv('WEB_THREADS', 8))
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        from waitress import serve
+        print("gunicorn is not available; serving with a single waitress process.")
+        from webhook import app
+        serve(app, host='0.0.0.0', port=port, threads=threads)
+        return
+
+    if workers > 1:
+        # Every worker must see the same sessions and contacts
+        os.environ.setdefault('STATE_BACKEND', 'sqlite')
+
+    class WebhookApplication(BaseApplication):
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Imported in each worker after the fork, so each process starts
+            # its own background threads (work queue, sweeper, send workers)
+            from webhook import app
+            return app
+
+    print(f"Serving webhook on port {port} with {workers} workers x {threads} threads "
+          f"(state backend: {os.getenv('STATE_BACKEND', 'memory')})")
+    WebhookApplication({
+        'bind': f"0.0.0.0:{port}",
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'preload_app': False,
+        'accesslog': '-' if '--access-log' in sys.argv else None,
+    }).run()
+
+if __name__ == '__main__':
+    serve_production()
@@ -1,37 +1,180 @@
 import speech_recognition as sr
+import json
+import os
+import threading
 import time
 import logging
 import sys
-from typing import Optional, Callable, List
+from typing import Any, Optional, Callable, Dict, List
+
+import metrics
+from audio_buffer import AudioCapture
+from phrase_matcher import PhraseMatcher
+from voice_activity import VoiceActivityDetector
+
+# Where ambient-noise calibration is persisted between runs
+CALIBRATION_PATH = os.path.join(os.path.expanduser('~'), '.bino', 'calibration.json')
+# Seconds of audio used for a full ambient-noise calibration
+CALIBRATION_DURATION = 3
+# Seconds to pause after an alert before listening again
+ALERT_COOLDOWN = 5
+# Seconds between attempts to reopen the microphone after capture failed
+CAPTURE_RETRY_DELAY = 5
 
 class SpeechHandler:
-    def __init__(self, wake_word: str = "bino", emergency_phrases: List[str] = None):
+    def __init__(self, wake_word: str = "bino", emergency_phrases: List[str] = None,
+                 calibration_path: Optional[str] = CALIBRATION_PATH, list_devices: bool = False,
+                 device: Optional[sr.AudioSource] = None,
+                 recognize: Optional[Callable[[sr.AudioData], Any]] = None,
+                 auto_calibrate: bool = True):
+        """
+        Args:
+            wake_word: Word that starts listening for an emergency phrase
+            emergency_phrases: Phrases that trigger an emergency
+            calibration_path: File used to persist noise calibration, or None to disable
+            list_devices: Print every available audio input device at startup
+            device: Audio source to listen to instead of the default microphone,
+                e.g. an sr.AudioFile for offline replay; it is read from the start
+            recognize: Speech recognition backend, called with an AudioData and
+                returning a result in recognize_google(show_all=True) format;
+                defaults to Google's speech recognition
+            auto_calibrate: Refresh the noise calibration from live audio in the background
+        """
         self.recognizer = sr.Recognizer()
         self.wake_word = wake_word.lower()
         self.emergency_phrases = emergency_phrases or ["i'm in danger", "help me", "emergency"]
         self.is_listening = False
+        self.calibration_path = calibration_path
+        self.recognize = recognize or (lambda audio: self.recognizer.recognize_google(audio, show_all=True))
+        self.alert_cooldown = ALERT_COOLDOWN
+        # Seconds spent in each startup step, for the startup report
+        self.startup_times: Dict[str, float] = {}
+        # Precompiled matchers, checked against every recognizer alternative
+        # The wake word only matches exactly: a short word sounds like too many
+        # everyday ones ("been", "bone"), and silence after it raises an alert
+        self.wake_word_matcher = PhraseMatcher([self.wake_word], min_fuzzy_length=len(self.wake_word) + 1)
+        self.emergency_matcher = PhraseMatcher(self.emergency_phrases)
+        # Drops non-speech audio before it costs a recognizer round-trip
+        self.vad = VoiceActivityDetector()
         
-        # List available microphones
         try:
-            self.available_mics = sr.Microphone.list_microphone_names()
-            print("\nAvailable audio input devices:")
-            for i, mic in enumerate(self.available_mics):
-                print(f"{i}: {mic}")
+            # Enumerating devices is slow, so only do it on request
+            if list_devices:
+                self.available_mics = sr.Microphone.list_microphone_names()
+                print("\nAvailable audio input devices:")
+                for i, mic in enumerate(self.available_mics):
+                    print(f"{i}: {mic}")
             
             # Try to use the default microphone first
-            self.microphone = sr.Microphone()
-            print("\nUsing default microphone.")
+            start = time.perf_counter()
+            if device is None:
+                self.microphone = sr.Microphone()
+                print("\nUsing default microphone.")
+            else:
+                self.microphone = device
+            
+            # Keep the microphone open and stream it into a ring buffer so no
+            # audio is lost between listens
+            self.capture = AudioCapture(self.microphone)
+            self.capture.start()
+            self.source = self.capture.open_reader(from_oldest=device is not None)
+            self.startup_times['microphone'] = time.perf_counter() - start
             
-            # Adjust for ambient noise with a longer timeout
-            with self.microphone as source:
-                print("Adjusting for ambient noise, please wait...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=3)
+            # Reuse the last calibration so listening starts immediately, and
+            # refresh it from live audio in the background
+            start = time.perf_counter()
+            if not self._load_calibration() and auto_calibrate:
+                print("No saved noise calibration; calibrating in the background...")
+            self.startup_times['calibration'] = time.perf_counter() - start
+            if auto_calibrate:
+                threading.Thread(target=self.recalibrate, name='noise-calibration', daemon=True).start()
                 
         except OSError as e:
             print(f"\nError initializing microphone: {e}")
             print("Please check your audio input devices and try again.")
             sys.exit(1)
+
+    def _load_calibration(self) -> bool:
+        """Apply persisted calibration values. Returns True if any were loaded."""
+        if not self.calibration_path:
+            return False
+        try:
+            with open(self.calibration_path, 'r') as f:
+                calibration = json.load(f)
+            self.recognizer.energy_threshold = float(calibration['energy_threshold'])
+            if calibration.get('vad_noise_floor') is not None:
+                self.vad.noise_floor = float(calibration['vad_noise_floor'])
+            logging.info(f"Loaded noise calibration (energy threshold {self.recognizer.energy_threshold:.0f})")
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable calibration file {self.calibration_path}: {e}")
+            return False
+
+    def _save_calibration(self):
+        """Persist the current calibration values atomically."""
+        if not self.calibration_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.calibration_path), exist_ok=True)
+            tmp_path = f"{self.calibration_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'energy_threshold': self.recognizer.energy_threshold,
+                    'vad_noise_floor': self.vad.noise_floor,
+                    'saved_at': time.time()
+                }, f)
+            os.replace(tmp_path, self.calibration_path)
+        except OSError as e:
+            logging.warning(f"Could not save noise calibration: {e}")
+
+    def recalibrate(self, duration: float = CALIBRATION_DURATION):
+        """
+        Measure ambient noise from the capture buffer and persist the result.
+        
+        Uses its own reader and recognizer, so it can run while the main loop
+        is listening without stealing audio from it. The VAD noise floor is
+        measured on the same ambient audio as the energy threshold.
+        """
+        try:
+            reader = self.capture.open_reader()
+            start = reader.stream.cursor
+            calibrator = sr.Recognizer()
+            calibrator.adjust_for_ambient_noise(reader, duration=duration)
+            self.recognizer.energy_threshold = calibrator.energy_threshold
+            # Read back the audio the calibration consumed; the ring still holds it
+            ambient, _ = self.capture.ring.read(start, reader.stream.cursor - start, timeout=0)
+            self.vad.calibrate(ambient, reader.SAMPLE_RATE, reader.SAMPLE_WIDTH)
+            self._save_calibration()
+            logging.info(f"Noise calibration updated (energy threshold {calibrator.energy_threshold:.0f}, "
+                         f"VAD noise floor {self.vad.noise_floor:.5f})")
+        except Exception as e:
+            logging.warning(f"Background noise calibration failed: {e}")
+    
+    def _recognize_alternatives(self, audio: sr.AudioData) -> List[str]:
+        """
+        Recognize speech and return every alternative transcript, best first.
+        
+        Raises:
+            sr.UnknownValueError: If the speech could not be understood
+        """
+        result = self.recognize(audio)
+        alternatives = [alt['transcript'].lower() for alt in (result or {}).get('alternative', [])
+                        if alt.get('transcript')] if isinstance(result, dict) else []
+        if not alternatives:
+            raise sr.UnknownValueError()
+        return alternatives
     
+    def _listen(self, phase: str, timeout: float, phrase_time_limit: float) -> sr.AudioData:
+        """Capture one phrase from the audio buffer, recording how long it took."""
+        start = time.perf_counter()
+        try:
+            return self.recognizer.listen(self.source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        finally:
+            # Timeouts are part of normal operation, so they are not counted as errors
+            metrics.observe(metrics.STAGE_METRIC, time.perf_counter() - start, stage='capture', phase=phase)
+
     def listen_for_wake_word(self, timeout: int = 5) -> bool:
         """
         Listen for the wake word.
@@ -44,15 +187,24 @@ class SpeechHandler:
         """
         print(f"Say '{self.wake_word}' to start...")
         try:
-            with self.microphone as source:
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=3)
+            audio = self._listen('wake', timeout, phrase_time_limit=3)
+
+            # Skip recognition for noise that triggered the energy threshold
+            with metrics.timed('vad', phase='wake'):
+                speech = self.vad.extract_speech(audio)
+            if speech is None:
+                return False
                 
             # Recognize speech using Google's speech recognition
-            text = self.recognizer.recognize_google(audio).lower()
-            print(f"Heard: {text}")
+            with metrics.timed('recognize', phase='wake'):
+                alternatives = self._recognize_alternatives(speech)
+            print(f"Heard: {alternatives[0]}")
             
-            if self.wake_word in text:
+            with metrics.timed('match', phase='wake'):
+                match = self.wake_word_matcher.match(alternatives)
+            if match:
                 print("Wake word detected!")
+                metrics.inc('bino_detections_total', kind='wake_word', match=match.kind)
                 return True
                 
         except sr.WaitTimeoutError:
@@ -77,20 +229,39 @@ class SpeechHandler:
         print("Listening for emergency phrase... (say 'I'm in danger' or stay silent for 5 seconds)")
         
         try:
-            with self.microphone as source:
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=timeout)
+            # Sounds without speech (a TV, traffic) do not end the wait, but do
+            # not count as silence either: keep listening until timeout seconds
+            # of audio passed with nothing voiced
+            source = self.source
+            start = source.stream.cursor
+            bytes_per_second = source.SAMPLE_RATE * source.SAMPLE_WIDTH
+            while True:
+                remaining = timeout - (source.stream.cursor - start) / bytes_per_second
+                if remaining <= 0:
+                    raise sr.WaitTimeoutError()
+                audio = self._listen('emergency', remaining, phrase_time_limit=timeout)
+                with metrics.timed('vad', phase='emergency'):
+                    speech = self.vad.extract_speech(audio)
+                if speech is not None:
+                    break
+                logging.debug("Emergency listen heard sound without speech; still listening")
                 
             # Try to recognize the speech
-            text = self.recognizer.recognize_google(audio).lower()
-            print(f"Heard: {text}")
+            with metrics.timed('recognize', phase='emergency'):
+                alternatives = self._recognize_alternatives(speech)
+            print(f"Heard: {alternatives[0]}")
             
             # Check for emergency phrases
-            if any(phrase in text for phrase in self.emergency_phrases):
-                print("Emergency phrase detected!")
+            with metrics.timed('match', phase='emergency'):
+                match = self.emergency_matcher.match(alternatives)
+            if match:
+                print(f"Emergency phrase detected! ({match.kind} match for '{match.phrase}')")
+                metrics.inc('bino_detections_total', kind='emergency', match=match.kind)
                 return True
                 
         except sr.WaitTimeoutError:
             print("No speech detected. Treating as emergency due to silence.")
+            metrics.inc('bino_detections_total', kind='emergency', match='silence')
             return True
         except sr.UnknownValueError:
             print("Could not understand audio. Please try again.")
@@ -115,14 +286,38 @@ class SpeechHandler:
                     if self.listen_for_emergency():
                         emergency_callback()
                         # Wait a bit before listening again
-                        time.sleep(5)
+                        time.sleep(self.alert_cooldown)
+                        # Don't replay audio captured during the pause
+                        self.source.skip_to_live()
             except KeyboardInterrupt:
                 print("\nStopping Bino Emergency System...")
                 self.is_listening = False
+            except OSError:
+                # The capture thread has ended; nothing can be heard until it is restarted
+                if self.capture.error is None:
+                    print("Audio stream ended.")
+                    self.is_listening = False
+                else:
+                    self._restart_capture()
             except Exception as e:
                 print(f"An error occurred: {e}")
                 time.sleep(2)  # Prevent tight loop on errors
 
+        self.capture.stop()
+
+    def _restart_capture(self):
+        """Reopen the microphone after capture failed, e.g. because it was unplugged."""
+        print(f"\nMicrophone stopped working ({self.capture.error}). Bino cannot hear you; "
+              f"retrying in {CAPTURE_RETRY_DELAY}s...")
+        metrics.inc(metrics.STAGE_ERRORS_METRIC, stage='capture')
+        time.sleep(CAPTURE_RETRY_DELAY)
+        try:
+            self.capture.start()
+            self.source = self.capture.open_reader()
+            print("Microphone reopened.")
+        except Exception as e:
+            logging.error(f"Could not reopen the microphone: {e}")
+
 if __name__ == "__main__":
     def test_emergency():
         print("EMERGENCY DETECTED!")
@@ -0,0 +1,226 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metrics
+from whatsapp_sender import PRIORITY_EMERGENCY, WhatsAppSender
+from whatsapp_web_client import WhatsAppWebClient
+
+# Seconds to wait for a transport to confirm before also trying the next one
+DEFAULT_HEDGE_DELAY = 3.0
+# Overall seconds to wait for confirmations before reporting the outcome
+DEFAULT_DELIVERY_TIMEOUT = 30.0
+
+class Transport(ABC):
+    """
+    A way of delivering a message to WhatsApp contacts.
+
+    Subclasses must implement submit(), or they cannot be instantiated; the
+    other methods have safe defaults.
+    """
+
+    name = 'transport'
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the transport is configured; disabled ones are skipped."""
+        return True
+
+    @abstractmethod
+    def submit(self, recipients: Sequence[str], message: str) -> Dict[str, Future]:
+        """
+        Start sending a message without waiting for the result.
+
+        Returns:
+            Dict[str, Future]: Per-recipient future resolving to True once delivered
+        """
+
+    def delivered_elsewhere(self, recipient: str, message: str, future: Future):
+        """Another transport delivered the message; skip this send if still possible."""
+        future.cancel()
+
+class GraphTransport(Transport):
+    """WhatsApp Cloud API sends through the sender's priority queue and outbox."""
+
+    name = 'graph'
+
+    def __init__(self, sender: WhatsAppSender, durable: bool = True):
+        """
+        Args:
+            sender: Graph API sender
+            durable: Record sends in the outbox so failures are retried later
+        """
+        self.sender = sender
+        self.durable = durable
+
+    def submit(self, recipients: Sequence[str], message: str) -> Dict[str, Future]:
+        return self.sender.dispatch(recipients, message, PRIORITY_EMERGENCY, durable=self.durable)
+
+    def delivered_elsewhere(self, recipient: str, message: str, future: Future):
+        # Stop the outbox from retrying first, so the cancellation below is
+        # not recorded as a failure to retry
+        if self.durable and self.sender.outbox is not None:
+            try:
+                self.sender.outbox.mark_sent(recipient, message)
+            except Exception as e:
+                logging.error(f"Could not mark outbox message to {recipient} as sent: {e}")
+        future.cancel()
+
+class WhatsAppWebTransport(Transport):
+    """Sends through the WhatsApp Web daemon (python whatsapp_auto.py --daemon)."""
+
+    name = 'whatsapp_web'
+
+    def __init__(self, client: WhatsAppWebClient):
+        self.client = client
+
+    @property
+    def enabled(self) -> bool:
+        return self.client.enabled
+
+    def submit(self, recipients: Sequence[str], message: str) -> Dict[str, Future]:
+        futures = {recipient: Future() for recipient in dict.fromkeys(recipients)}
+        threading.Thread(target=self._send, args=(futures, message),
+                         name='whatsapp-web-send', daemon=True).start()
+        return futures
+
+    def _send(self, futures: Dict[str, Future], message: str):
+        # The daemon sends a batch in parallel, so send everyone still needed at once
+        batch = [recipient for recipient, future in futures.items() if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = self.client.send(batch, message)
+        for recipient in batch:
+            futures[recipient].set_result(results.get(recipient, False))
+
+class HedgedDelivery:
+    """
+    Delivers a message over several transports, the first success winning.
+
+    Every recipient starts on the first enabled transport. If it has not
+    confirmed within the hedge delay, or has failed, the next transport is
+    tried as well, and so on. Once one transport confirms, every other attempt
+    at the same message to that recipient is told, finished or not: sends
+    that have not started are called off, and a durable send that already
+    failed is marked as sent so its outbox retry does not deliver it late.
+    Sends already in flight cannot be recalled and are counted in
+    bino_duplicate_deliveries_total if they also succeed.
+    """
+
+    def __init__(self, transports: Sequence[Transport], hedge_delay: float = DEFAULT_HEDGE_DELAY,
+                 timeout: float = DEFAULT_DELIVERY_TIMEOUT):
+        """
+        Args:
+            transports: Transports in order of preference
+            hedge_delay: Seconds to wait for a confirmation before adding the next transport
+            timeout: Seconds to wait for all confirmations
+        """
+        self.transports = list(transports)
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+
+    def deliver(self, recipients: Iterable[str], message: str) -> Dict[str, Optional[str]]:
+        """
+        Deliver a message to every recipient over the first transport that succeeds.
+
+        Returns:
+            Dict[str, Optional[str]]: Per-recipient name of the transport that
+            delivered it, or None if none did before the timeout
+        """
+        recipients = list(dict.fromkeys(r for r in recipients if r))
+        transports = [t for t in self.transports if t.enabled]
+        winners: Dict[str, Optional[str]] = {r: None for r in recipients}
+        if not recipients or not transports:
+            return winners
+
+        cond = threading.Condition()
+        attempts: Dict[str, List[Tuple[Transport, Future]]] = {r: [] for r in recipients}
+        next_transport = {r: 0 for r in recipients}
+        hedge_at = {r: 0.0 for r in recipients}
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        def on_done(future: Future, recipient: str, transport: Transport, launched: float):
+            if future.cancelled():
+                return
+            try:
+                ok = bool(future.result())
+            except Exception as e:
+                logging.error(f"{transport.name} send to {recipient} failed: {e}")
+                ok = False
+            metrics.observe(metrics.STAGE_METRIC, time.monotonic() - launched, stage='transport',
+                            transport=transport.name, result='sent' if ok else 'failed')
+            suppress = []
+            with cond:
+                if ok and winners[recipient] is None:
+                    winners[recipient] = transport.name
+                    metrics.inc('bino_delivery_wins_total', transport=transport.name)
+                    # Including finished attempts: a failed durable send has a retry queued
+                    suppress = [(t, f) for t, f in attempts[recipient] if f is not future]
+                elif ok:
+                    metrics.inc('bino_duplicate_deliveries_total', transport=transport.name)
+                cond.notify_all()
+            for other, other_future in suppress:
+                other.delivered_elsewhere(recipient, message, other_future)
+
+        def launch(transport: Transport, targets: List[str]):
+            launched = time.monotonic()
+            try:
+                futures = transport.submit(targets, message)
+            except Exception as e:
+                logging.error(f"Could not start {transport.name} delivery: {e}")
+                futures = {}
+            for recipient in targets:
+                future = futures.get(recipient)
+                if future is None:
+                    future = Future()
+                    future.set_result(False)
+                with cond:
+                    attempts[recipient].append((transport, future))
+                    won_meanwhile = winners[recipient] is not None
+                if won_meanwhile:
+                    # Another transport confirmed while this one was being started
+                    transport.delivered_elsewhere(recipient, message, future)
+                future.add_done_callback(
+                    lambda f, r=recipient: on_done(f, r, transport, launched))
+            with cond:
+                cond.notify_all()
+
+        while True:
+            batches: Dict[int, List[str]] = {}
+            with cond:
+                now = time.monotonic()
+                waiting = False
+                for r in recipients:
+                    if winners[r] is not None:
+                        continue
+                    exhausted = all(f.done() for _, f in attempts[r])
+                    if next_transport[r] < len(transports) and (exhausted or now >= hedge_at[r]):
+                        batches.setdefault(next_transport[r], []).append(r)
+                        next_transport[r] += 1
+                        hedge_at[r] = now + self.hedge_delay
+                        waiting = True
+                    elif not exhausted:
+                        waiting = True
+                if not batches:
+                    if not waiting or now >= deadline:
+                        break
+                    pending_hedges = [hedge_at[r] for r in recipients
+                                      if winners[r] is None and next_transport[r] < len(transports)]
+                    cond.wait(min(pending_hedges + [deadline]) - now)
+                    continue
+            for index, targets in sorted(batches.items()):
+                if index:
+                    logging.info(f"No confirmation from {transports[index - 1].name} for "
+                                 f"{len(targets)} recipient(s); also sending via {transports[index].name}")
+                launch(transports[index], targets)
+
+        delivered = sum(1 for name in winners.values() if name)
+        by_transport = ', '.join(f"{t.name}: {sum(1 for n in winners.values() if n == t.name)}"
+                                 for t in transports)
+        logging.info(f"Delivered to {delivered}/{len(recipients)} recipients in "
+                     f"{time.monotonic() - start:.2f}s ({by_transport})")
+        return winners
@@ -0,0 +1,115 @@
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Sample widths supported by speech_recognition.AudioData, mapped to NumPy dtypes
+_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+class VoiceActivityDetector:
+    """
+    Energy and zero-crossing-rate voice activity detector.
+
+    Splits raw audio into short frames, marks frames that are louder than the
+    running noise floor and have a speech-like zero-crossing rate, and trims the
+    audio to the voiced region so that only speech reaches the recognizer.
+    """
+
+    def __init__(self, frame_ms: int = 30, energy_ratio: float = 3.0,
+                 zcr_range: Tuple[float, float] = (0.01, 0.35), min_speech_ms: int = 150,
+                 padding_ms: int = 200, noise_floor: Optional[float] = None):
+        """
+        Args:
+            frame_ms: Analysis frame length in milliseconds
+            energy_ratio: How far above the noise floor a frame's RMS energy must be
+            zcr_range: Zero-crossing rate (crossings per sample) accepted as speech;
+                broadband noise and hiss sit above the upper bound
+            min_speech_ms: Minimum voiced duration for a segment to count as speech
+            padding_ms: Audio kept on each side of the voiced region
+            noise_floor: Initial RMS noise floor (0-1 scale); estimated from the
+                first audio seen if not given
+        """
+        self.frame_ms = frame_ms
+        self.energy_ratio = energy_ratio
+        self.zcr_min, self.zcr_max = zcr_range
+        self.min_speech_ms = min_speech_ms
+        self.padding_ms = padding_ms
+        self.noise_floor = noise_floor
+        # Lower bound so digital silence does not make every sound look like speech
+        self.min_noise_floor = 1e-4
+
+    def frame_features(self, raw: bytes, sample_rate: int, sample_width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute per-frame RMS energy and zero-crossing rate.
+
+        Returns:
+            tuple: (energy, zcr) arrays with one value per frame
+        """
+        samples = np.frombuffer(raw, dtype=_DTYPES[sample_width])
+        if sample_width == 1:
+            # 8-bit audio is unsigned
+            samples = samples.astype(np.int16) - 128
+        scale = float(2 ** (8 * sample_width - 1))
+
+        frame_len = max(1, int(sample_rate * self.frame_ms / 1000))
+        n_frames = len(samples) // frame_len
+        if n_frames == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+
+        frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32) / scale
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(frame_len)
+        return energy, zcr
+
+    def calibrate(self, raw: bytes, sample_rate: int, sample_width: int):
+        """Set the noise floor from audio known to hold only background noise."""
+        energy, _ = self.frame_features(raw, sample_rate, sample_width)
+        if energy.size:
+            # The median ignores a short knock or click during calibration
+            self.noise_floor = float(np.median(energy))
+
+    def speech_mask(self, energy: np.ndarray, zcr: np.ndarray) -> np.ndarray:
+        """Classify frames as speech and adapt the noise floor from the rest."""
+        if self.noise_floor is None:
+            # Quietest frames of the first capture approximate the background
+            self.noise_floor = float(np.percentile(energy, 10))
+        floor = max(self.noise_floor, self.min_noise_floor)
+
+        loud = energy > floor * self.energy_ratio
+        mask = loud & (zcr >= self.zcr_min) & (zcr <= self.zcr_max)
+
+        # Only quiet frames feed the floor; loud hiss is rejected by ZCR instead
+        background = energy[~loud]
+        if background.size:
+            # Slow exponential moving average so a burst of noise does not mask speech
+            self.noise_floor = 0.9 * floor + 0.1 * float(np.median(background))
+        return mask
+
+    def extract_speech(self, audio):
+        """
+        Trim audio to its voiced region.
+
+        Args:
+            audio: A speech_recognition.AudioData instance
+
+        Returns:
+            AudioData: The voiced segment (with padding), or None if the audio
+            contains no speech
+        """
+        raw = audio.get_raw_data()
+        energy, zcr = self.frame_features(raw, audio.sample_rate, audio.sample_width)
+        if energy.size == 0:
+            return None
+
+        mask = self.speech_mask(energy, zcr)
+        voiced = np.flatnonzero(mask)
+        if voiced.size * self.frame_ms < self.min_speech_ms:
+            logging.debug(f"VAD rejected segment: {voiced.size} voiced of {mask.size} frames")
+            return None
+
+        pad = self.padding_ms // self.frame_ms
+        first = max(0, int(voiced[0]) - pad)
+        last = min(mask.size, int(voiced[-1]) + 1 + pad)
+        frame_bytes = max(1, int(audio.sample_rate * self.frame_ms / 1000)) * audio.sample_width
+        return type(audio)(raw[first * frame_bytes:last * frame_bytes], audio.sample_rate, audio.sample_width)
@@ -1,26 +1,75 @@
-from flask import Flask, request, jsonify
-from whatsapp_sender import WhatsAppSender
-from speech_handler import SpeechHandler
+from flask import Flask, Response, request, jsonify
+import metrics
+from config_store import get_store
+from whatsapp_sender import PRIORITY_CONFIRMATION, PRIORITY_NOTICE, WhatsAppSender
+from whatsapp_web_client import WhatsAppWebClient
+from transports import (DEFAULT_DELIVERY_TIMEOUT, DEFAULT_HEDGE_DELAY, GraphTransport, HedgedDelivery,
+                        WhatsAppWebTransport)
+from location_resolver import DEFAULT_BUDGET, LocationResolver, PushedLocationProvider
 from location_service import LocationService
+from location_tracker import DEFAULT_DURATION, DEFAULT_MAX_INTERVAL, DEFAULT_MIN_DISTANCE, LocationTracker
+from work_queue import WorkQueue
+from webhook_state import STATE_DB_PATH, create_state
 import os
-import threading
+import hmac
 import json
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime
+from typing import List, Optional
 
 app = Flask(__name__)
 
-# Initialize services
-whatsapp = WhatsAppSender()
-speech_handler = SpeechHandler()
-location_service = LocationService()
+# Shared configuration snapshot, reloaded when config.json or .env changes
+config_store = get_store()
 
-# Store the last 10 contacts who messaged
-recent_contacts = []
-MAX_RECENT_CONTACTS = 10
+# Initialize services
+whatsapp = WhatsAppSender(config_store=config_store)
+location_service = LocationService(resolver=LocationResolver.from_env(
+    float(config_store.snapshot.get('location_budget', DEFAULT_BUDGET)),
+    push_enabled=bool(config_store.snapshot.get('location_push_token'))
+))
+# Coordinates pushed by the browser extension; raced against IP geolocation and gpsd
+pushed_locations = PushedLocationProvider()
+# Alerts go out over the Graph API, hedged with the WhatsApp Web daemon (if
+# whatsapp_daemon_url is set) when confirmation is slow
+whatsapp_web = WhatsAppWebClient(config_store=config_store)
+delivery = HedgedDelivery(
+    [GraphTransport(whatsapp), WhatsAppWebTransport(whatsapp_web)],
+    hedge_delay=float(config_store.snapshot.get('hedge_delay', DEFAULT_HEDGE_DELAY)),
+    timeout=float(config_store.snapshot.get('delivery_timeout', DEFAULT_DELIVERY_TIMEOUT))
+)
+# Live location updates to the alerted contacts
+location_tracker = LocationTracker(
+    location_service, whatsapp,
+    min_distance=float(config_store.snapshot.get('tracking_min_distance', DEFAULT_MIN_DISTANCE)),
+    max_interval=float(config_store.snapshot.get('tracking_max_interval', DEFAULT_MAX_INTERVAL)),
+    duration=float(config_store.snapshot.get('tracking_duration', DEFAULT_DURATION))
+)
 
-# Store active sessions (phone number -> timestamp)
-active_sessions = {}
+MAX_RECENT_CONTACTS = int(os.getenv('MAX_RECENT_CONTACTS', 10))
 SESSION_TIMEOUT = 300  # 5 minutes
+SESSION_EXPIRED_MESSAGE = "⏰ Session expired. Send 'activate' to enable emergency mode again."
+
+# Shared state: 'memory' for a single process, 'sqlite' when several worker
+# processes serve the webhook (see serve.py)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+
+# active_sessions: phone number -> deadline, expired close to their deadline.
+#   Expiry notices go on the low-priority send queue so the sweeper never blocks on HTTP
+# recent_contacts: the last MAX_RECENT_CONTACTS contacts who messaged
+# deduplicator: Meta redelivers slow-to-ack payloads; drops messages we already handled
+active_sessions, recent_contacts, deduplicator = create_state(
+    STATE_BACKEND,
+    SESSION_TIMEOUT,
+    on_expire=lambda number: whatsapp.enqueue_message(number, SESSION_EXPIRED_MESSAGE, PRIORITY_NOTICE),
+    contacts_capacity=MAX_RECENT_CONTACTS,
+    snapshot_path=os.getenv('RECENT_CONTACTS_SNAPSHOT') or None,
+    db_path=os.getenv('STATE_DB_PATH', STATE_DB_PATH)
+)
+active_sessions.start()
+
+# Acknowledge webhooks immediately and process them on the work queue
+FAST_ACK = os.getenv('WEBHOOK_FAST_ACK', 'true').lower() in ('1', 'true', 'yes')
 
 @app.route('/webhook', methods=['GET', 'POST'])
 def webhook():
@@ -30,98 +79,200 @@ def webhook():
         token = request.args.get('hub.verify_token')
         challenge = request.args.get('hub.challenge')
         
-        verify_token = os.getenv('VERIFY_TOKEN', 'bino_emergency')
-        
-        if mode == 'subscribe' and token == verify_token:
+        if mode == 'subscribe' and token == config_store.snapshot.verify_token:
             return challenge, 200
         return 'Verification failed', 403
     
     # Handle incoming messages
-    data = request.get_json()
-    print(f"Received webhook data: {json.dumps(data, indent=2)}")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('entry'), list):
+        return jsonify({'status': 'error', 'message': 'Invalid payload'}), 400
+
+    if not FAST_ACK:
+        process_webhook(data)
+        return jsonify({'status': 'ok'}), 200
+
+    # Acknowledge right away; location lookup and sends happen on the workers
+    if not work_queue.submit(data):
+        # Tell Meta to redeliver later rather than silently dropping the event
+        return jsonify({'status': 'busy'}), 503, {'Retry-After': '5'}
+    return jsonify({'status': 'queued'}), 200
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Report webhook work queue depth and backpressure counters."""
+    return jsonify({
+        'work_queue': work_queue.stats(),
+        'send_queue': whatsapp.scheduler.stats(),
+        'active_sessions': len(active_sessions),
+        'deduplication': deduplicator.stats()
+    }), 200
+
+@app.route('/location', methods=['POST'])
+def push_location():
+    """
+    Receive browser geolocation from the extension.
+    
+    Expects {"latitude", "longitude", "accuracy" (metres), "timestamp" (ms)} and
+    the header "Authorization: Bearer <location_push_token>".
+    """
+    token = config_store.snapshot.get('location_push_token')
+    if not token:
+        return jsonify({'status': 'error', 'message': 'Location push is not enabled'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'status': 'error', 'message': 'Invalid token'}), 401
     
+    data = request.get_json(silent=True)
     try:
-        entry = data['entry'][0]
-        changes = entry.get('changes', [])
-        
-        for change in changes:
-            if change.get('field') == 'messages':
-                value = change.get('value', {})
-                messages = value.get('messages', [])
-                
-                for message in messages:
-                    from_number = message.get('from')
-                    if not from_number:
-                        continue
-                        
-                    # Add to recent contacts if not already present
-                    if from_number not in [c[0] for c in recent_contacts]:
-                        recent_contacts.insert(0, (from_number, datetime.now()))
-                        # Keep only the most recent contacts
-                        if len(recent_contacts) > MAX_RECENT_CONTACTS:
-                            recent_contacts.pop()
-                    
-                    # Check if message contains text
-                    if 'text' in message.get('type', '').lower():
-                        text = message.get('text', {}).get('body', '').lower()
-                        
-                        # Check for activation message
-                        if 'activate' in text:
-                            active_sessions[from_number] = datetime.now()
-                            whatsapp.send_message(from_number, "🔊 Bino is now active. Say 'bino' to send emergency alerts to recent contacts.")
-                        
-                        # Check for wake word
-                        elif 'bino' in text and from_number in active_sessions:
-                            # Get location and send to recent contacts
-                            location = location_service.get_current_location()
-                            message = f"🚨 EMERGENCY ALERT from {os.getenv('USER_NAME', 'a user')} 🚨\n\n" \
-                                    f"📍 Location: {location.get('address', 'Unknown location')}\n" \
-                                    f"🗺️ Map: {location.get('maps_link', 'No location available')}\n\n" \
-                                    f"⏰ Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                            
-                            # Send to recent contacts
-                            sent_to = []
-                            for contact, _ in recent_contacts:
-                                if contact != from_number:  # Don't send to the person who triggered the alert
-                                    if whatsapp.send_message(contact, message):
-                                        sent_to.append(contact)
-                            
-                            # Send confirmation
-                            if sent_to:
-                                whatsapp.send_message(from_number, f"✅ Emergency alert sent to {len(sent_to)} contacts.")
-                            else:
-                                whatsapp.send_message(from_number, "❌ No contacts available to send the alert to.")
-                            
-                            # End the session
-                            if from_number in active_sessions:
-                                del active_sessions[from_number]
+        timestamp = data.get('timestamp')
+        fix = pushed_locations.push(float(data['latitude']), float(data['longitude']),
+                                    float(data['accuracy']),
+                                    float(timestamp) / 1000 if timestamp else None)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f"Invalid location: {e}"}), 400
+    metrics.inc('bino_location_pushes_total')
+    return jsonify({'status': 'ok', 'accuracy': fix.accuracy}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Per-stage latency histograms and counters in Prometheus text format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@metrics.timed('webhook_process')
+def process_webhook(data: dict):
+    """
+    Process a validated webhook payload: track contacts, sessions and alerts.
     
-    except Exception as e:
-        print(f"Error processing webhook: {str(e)}")
+    Walks every entry, change and message in the batch. All 'bino' triggers in
+    the batch are coalesced into a single location fix and fan-out. Message
+    IDs are claimed in the deduplicator up front so concurrent redeliveries
+    are dropped, and released again if their processing fails, so Meta's
+    next redelivery is handled rather than discarded.
+    """
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Received webhook data: {json.dumps(data)}")
     
-    return jsonify({'status': 'ok'}), 200
-
-def cleanup_sessions():
-    """Clean up expired sessions."""
-    while True:
-        now = datetime.now()
-        expired = [num for num, ts in active_sessions.items() 
-                  if (now - ts).total_seconds() > SESSION_TIMEOUT]
+    triggers = []
+    trigger_messages = []  # Messages whose processing ends with the alert
+    for entry in data.get('entry') or ():
+        for change in entry.get('changes') or ():
+            if change.get('field') != 'messages':
+                continue
+            # Status callbacks (sent/delivered/read) carry no messages
+            messages = (change.get('value') or {}).get('messages')
+            if not messages:
+                continue
+            
+            for message in messages:
+                try:
+                    from_number = handle_message(message)
+                except Exception as e:
+                    print(f"Error processing webhook message: {str(e)}")
+                    _release(message)
+                    continue
+                if from_number:
+                    trigger_messages.append(message)
+                    if from_number not in triggers:
+                        triggers.append(from_number)
+    
+    if triggers:
+        try:
+            send_coalesced_alert(triggers)
+        except Exception as e:
+            print(f"Error processing webhook: {str(e)}")
+            for message in trigger_messages:
+                _release(message)
+
+def _release(message: dict):
+    """Let a redelivery of a message whose processing failed through the deduplicator."""
+    message_id = message.get('id')
+    if message_id:
+        try:
+            deduplicator.forget(message_id)
+        except Exception as e:
+            logging.error(f"Could not release message {message_id} for redelivery: {e}")
+
+def handle_message(message: dict) -> Optional[str]:
+    """
+    Handle a single incoming message.
+    
+    Returns:
+        str: The sender's number if the message triggers an emergency alert, None otherwise
+    """
+    from_number = message.get('from')
+    if not from_number:
+        return None
+
+    # Skip redelivered messages before any expensive work
+    message_id = message.get('id')
+    if message_id and deduplicator.seen(message_id):
+        return None
+        
+    # Mark as the most recent contact (evicts the oldest when full)
+    recent_contacts.touch(from_number)
+    
+    # Check if message contains text
+    if 'text' not in message.get('type', '').lower():
+        return None
+    text = message.get('text', {}).get('body', '').lower()
         
-        for num in expired:
-            del active_sessions[num]
-            whatsapp.send_message(num, "⏰ Session expired. Send 'activate' to enable emergency mode again.")
+    # Check for activation message
+    if 'activate' in text:
+        active_sessions.activate(from_number)
+        whatsapp.enqueue_message(from_number, "🔊 Bino is now active. Say 'bino' to send emergency alerts to recent contacts.",
+                                 PRIORITY_CONFIRMATION)
+    
+    # Check for wake word
+    elif 'bino' in text and from_number in active_sessions:
+        return from_number
+    return None
+
+@metrics.timed('alert')
+def send_coalesced_alert(triggers: List[str]):
+    """
+    Send one emergency alert for every trigger in a batch.
+    
+    Args:
+        triggers: Numbers that sent 'bino' with an active session
+    """
+    # Get location once and send to recent contacts
+    location = location_service.get_current_location() or {}
+    message = f"🚨 EMERGENCY ALERT from {config_store.snapshot.user_name or 'a user'} 🚨\n\n" \
+            f"📍 Location: {location.get('address', 'Unknown location')}\n" \
+            f"🗺️ Map: {location.get('maps_link', 'No location available')}\n\n" \
+            f"⏰ Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    
+    # Send to recent contacts concurrently
+    # Don't send to the people who triggered the alert
+    recipients = [contact for contact in recent_contacts.contacts() if contact not in triggers]
+    delivered = delivery.deliver(recipients, message)
+    sent_to = [contact for contact, transport in delivered.items() if transport]
+    metrics.inc('bino_alerts_total', source='webhook', result='sent' if sent_to else 'no_contacts')
+    if sent_to and location:
+        location_tracker.track(sent_to, location)
+    
+    for from_number in triggers:
+        # Send confirmation
+        if sent_to:
+            whatsapp.enqueue_message(from_number, f"✅ Emergency alert sent to {len(sent_to)} contacts.",
+                                     PRIORITY_CONFIRMATION)
+        else:
+            whatsapp.enqueue_message(from_number, "❌ No contacts available to send the alert to.",
+                                     PRIORITY_CONFIRMATION)
         
-        # Sleep for 1 minute
-        import time
-        time.sleep(60)
+        # End the session
+        active_sessions.end(from_number)
+
+# Process webhook payloads on a background worker pool
+work_queue = WorkQueue(
+    process_webhook,
+    num_workers=int(os.getenv('WEBHOOK_WORKERS', 4)),
+    max_size=int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)),
+    name='webhook'
+)
+work_queue.start()
 
 if __name__ == '__main__':
-    # Start session cleanup thread
-    import threading
-    thread = threading.Thread(target=cleanup_sessions, daemon=True)
-    thread.start()
-    
     # Run the Flask app
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,513 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+class SessionStore:
+    """
+    Thread-safe store of active sessions with deadline-ordered expiry.
+
+    Deadlines live in a min-heap, so activation is O(log n) and a sweeper
+    thread sleeps until the earliest deadline instead of scanning every
+    session on a fixed interval. Re-activating a session leaves its old heap
+    entry behind; stale entries are skipped when popped and compacted away
+    when they start to dominate the heap.
+    """
+
+    def __init__(self, timeout: float, on_expire: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            timeout: Session lifetime in seconds
+            on_expire: Called with the key of each expired session; it runs on
+                the sweeper thread, so it should only hand work off (e.g. enqueue)
+        """
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self._deadlines: Dict[str, Tuple[float, int]] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        """Start the expiry sweeper thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the expiry sweeper thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def activate(self, key: str):
+        """Start or extend a session."""
+        with self._cond:
+            seq = next(self._counter)
+            deadline = time.monotonic() + self.timeout
+            self._deadlines[key] = (deadline, seq)
+            heapq.heappush(self._heap, (deadline, seq, key))
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._compact()
+            # Wake the sweeper if this is now the earliest deadline
+            if self._heap[0][1] == seq:
+                self._cond.notify()
+
+    def is_active(self, key: str) -> bool:
+        """Return True if the session exists and has not passed its deadline."""
+        with self._cond:
+            entry = self._deadlines.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def end(self, key: str) -> bool:
+        """
+        End a session.
+
+        Returns:
+            bool: True if the session was active
+        """
+        with self._cond:
+            entry = self._deadlines.pop(key, None)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def __contains__(self, key: str) -> bool:
+        return self.is_active(key)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._deadlines)
+
+    def _compact(self):
+        self._heap = [(deadline, seq, key) for key, (deadline, seq) in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_expired(self, now: float) -> List[str]:
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            entry = self._deadlines.get(key)
+            if entry is not None and entry[1] == seq:
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
+
+    def _sweep_loop(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                expired = self._pop_expired(now)
+                if not expired:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+
+            for key in expired:
+                if self.on_expire:
+                    try:
+                        self.on_expire(key)
+                    except Exception as e:
+                        logging.error(f"Error handling expiry of session {key}: {e}")
+
+class RecentContacts:
+    """
+    Thread-safe, bounded LRU index of the contacts who messaged most recently.
+
+    Lookups and updates are O(1). When a snapshot path is given, the index is
+    loaded from it at startup and changes are flushed to it periodically by a
+    background thread, so a restart keeps the fan-out list.
+    """
+
+    def __init__(self, capacity: int = 10, snapshot_path: Optional[str] = None,
+                 snapshot_interval: float = 5.0):
+        """
+        Args:
+            capacity: Maximum number of contacts kept
+            snapshot_path: JSON file to persist the index to, or None to keep it in memory only
+            snapshot_interval: Seconds between snapshot flushes when the index has changed
+        """
+        self.capacity = capacity
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        # Least recently seen first, most recently seen last
+        self._contacts: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serialises snapshot writers (flush thread and explicit save calls)
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._stop_event = threading.Event()
+        if snapshot_path:
+            self._load_snapshot()
+            threading.Thread(target=self._flush_loop, name='contacts-snapshot', daemon=True).start()
+
+    def touch(self, number: str):
+        """Record a message from number, making it the most recent contact."""
+        with self._lock:
+            self._contacts[number] = time.time()
+            self._contacts.move_to_end(number)
+            if len(self._contacts) > self.capacity:
+                self._contacts.popitem(last=False)
+            self._dirty = True
+
+    def contacts(self) -> List[str]:
+        """Return contact numbers, most recent first."""
+        with self._lock:
+            return list(reversed(self._contacts))
+
+    def __contains__(self, number: str) -> bool:
+        with self._lock:
+            return number in self._contacts
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._contacts)
+
+    def save(self):
+        """Write the snapshot now (atomically) if the index has changed."""
+        if not self.snapshot_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = list(self._contacts.items())
+                self._dirty = False
+            tmp_path = f"{self.snapshot_path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.snapshot_path)
+            except OSError as e:
+                logging.error(f"Could not save recent contacts snapshot: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def stop(self):
+        """Stop the flush thread after writing a final snapshot."""
+        self._stop_event.set()
+        self.save()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable recent contacts snapshot: {e}")
+            return
+        with self._lock:
+            for number, seen_at in entries[-self.capacity:]:
+                self._contacts[number] = seen_at
+        logging.info(f"Restored {len(entries[-self.capacity:])} recent contacts from snapshot")
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.snapshot_interval):
+            self.save()
+
+class MessageDeduplicator:
+    """
+    Bounded, time-windowed record of processed message IDs.
+
+    IDs are kept in insertion order with the time they were first seen, so
+    both the lookup and the eviction of expired or excess entries are O(1).
+    """
+
+    def __init__(self, capacity: int = 10000, window: float = 24 * 3600):
+        """
+        Args:
+            capacity: Maximum number of IDs remembered
+            window: Seconds an ID is remembered; Meta retries deliveries for up to a day
+        """
+        self.capacity = capacity
+        self.window = window
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def seen(self, message_id: str) -> bool:
+        """
+        Record a message ID.
+
+        Returns:
+            bool: True if the ID was already processed within the window
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Drop entries that fell out of the window (oldest first)
+            cutoff = now - self.window
+            while self._seen:
+                first_seen = next(iter(self._seen.values()))
+                if first_seen > cutoff:
+                    break
+                self._seen.popitem(last=False)
+
+            if message_id in self._seen:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            self._seen[message_id] = now
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            return False
+
+    def forget(self, message_id: str):
+        """Drop a message ID whose processing failed, so a redelivery is handled again."""
+        with self._lock:
+            self._seen.pop(message_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return duplicate hit/miss counters and current size."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._seen)}
+
+# Default database for state shared between webhook worker processes
+STATE_DB_PATH = os.path.join(os.path.expanduser('~'), '.bino', 'webhook_state.db')
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Open a WAL-mode SQLite connection that several processes can share."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class SqliteSessionStore:
+    """
+    SessionStore backed by SQLite, shared by every worker process.
+
+    Each process runs a sweeper; expired rows are deleted inside a write
+    transaction, so exactly one process sees (and notifies) each expiry.
+    Sweepers wake at the earliest known deadline and at least every
+    poll_interval to notice sessions created by other processes.
+    """
+
+    def __init__(self, timeout: float, on_expire: Optional[Callable[[str], None]] = None,
+                 path: str = STATE_DB_PATH, poll_interval: float = 1.0):
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.poll_interval = poll_interval
+        self._conn = _connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, deadline REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_deadline ON sessions (deadline)")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the expiry sweeper thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the expiry sweeper thread."""
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def activate(self, key: str):
+        """Start or extend a session."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sessions (key, deadline) VALUES (?, ?)",
+                               (key, time.time() + self.timeout))
+        self._wakeup.set()
+
+    def is_active(self, key: str) -> bool:
+        """Return True if the session exists and has not passed its deadline."""
+        with self._lock:
+            row = self._conn.execute("SELECT deadline FROM sessions WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def end(self, key: str) -> bool:
+        """
+        End a session.
+
+        Returns:
+            bool: True if the session was active
+        """
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE key = ? AND deadline > ?",
+                                         (key, time.time())).rowcount
+        return deleted > 0
+
+    def __contains__(self, key: str) -> bool:
+        return self.is_active(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _pop_expired(self) -> Tuple[List[str], Optional[float]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                expired = [row[0] for row in self._conn.execute(
+                    "SELECT key FROM sessions WHERE deadline <= ?", (now,))]
+                if expired:
+                    self._conn.execute("DELETE FROM sessions WHERE deadline <= ?", (now,))
+                next_deadline = self._conn.execute("SELECT MIN(deadline) FROM sessions").fetchone()[0]
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return expired, next_deadline
+
+    def _sweep_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                expired, next_deadline = self._pop_expired()
+            except sqlite3.Error as e:
+                logging.error(f"Session sweep failed: {e}")
+                expired, next_deadline = [], None
+
+            for key in expired:
+                if self.on_expire:
+                    try:
+                        self.on_expire(key)
+                    except Exception as e:
+                        logging.error(f"Error handling expiry of session {key}: {e}")
+
+            timeout = self.poll_interval
+            if next_deadline is not None:
+                timeout = max(0.0, min(timeout, next_deadline - time.time()))
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+class SqliteRecentContacts:
+    """RecentContacts backed by SQLite, shared by every worker process."""
+
+    def __init__(self, capacity: int = 10, path: str = STATE_DB_PATH):
+        self.capacity = capacity
+        self._conn = _connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS recent_contacts (number TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS recent_contacts_seen ON recent_contacts (seen_at)")
+        self._lock = threading.Lock()
+
+    def touch(self, number: str):
+        """Record a message from number, making it the most recent contact."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO recent_contacts (number, seen_at) VALUES (?, ?)",
+                                   (number, time.time()))
+                self._conn.execute(
+                    "DELETE FROM recent_contacts WHERE number NOT IN "
+                    "(SELECT number FROM recent_contacts ORDER BY seen_at DESC LIMIT ?)",
+                    (self.capacity,)
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def contacts(self) -> List[str]:
+        """Return contact numbers, most recent first."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT number FROM recent_contacts ORDER BY seen_at DESC LIMIT ?", (self.capacity,))]
+
+    def __contains__(self, number: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM recent_contacts WHERE number = ?",
+                                      (number,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recent_contacts").fetchone()[0]
+
+    def stop(self):
+        pass
+
+class SqliteMessageDeduplicator:
+    """MessageDeduplicator backed by SQLite, so a redelivery to any worker is caught."""
+
+    def __init__(self, window: float = 24 * 3600, path: str = STATE_DB_PATH, purge_every: int = 1000):
+        self.window = window
+        self.purge_every = purge_every
+        self._conn = _connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen_messages (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS seen_messages_seen ON seen_messages (seen_at)")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Calls left before the next purge of expired IDs
+        self._until_purge = 0
+
+    def seen(self, message_id: str) -> bool:
+        """
+        Record a message ID.
+
+        Returns:
+            bool: True if the ID was already processed within the window
+        """
+        now = time.time()
+        with self._lock:
+            self._until_purge -= 1
+            if self._until_purge <= 0:
+                self._until_purge = self.purge_every
+                self._conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - self.window,))
+            inserted = self._conn.execute("INSERT OR IGNORE INTO seen_messages (id, seen_at) VALUES (?, ?)",
+                                          (message_id, now)).rowcount
+            if inserted:
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def forget(self, message_id: str):
+        """Drop a message ID whose processing failed, so a redelivery is handled again."""
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_messages WHERE id = ?", (message_id,))
+
+    def stats(self) -> Dict[str, int]:
+        """Return this process's hit/miss counters and the shared table size."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM seen_messages").fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+def create_state(backend: str, session_timeout: float, on_expire: Callable[[str], None],
+                 contacts_capacity: int, snapshot_path: Optional[str] = None,
+                 db_path: str = STATE_DB_PATH):
+    """
+    Build the webhook's session store, recent-contacts index and deduplicator.
+
+    Args:
+        backend: 'memory' for a single process, or 'sqlite' to share state
+            between worker processes through db_path
+
+    Returns:
+        tuple: (sessions, recent_contacts, deduplicator)
+    """
+    if backend == 'sqlite':
+        return (
+            SqliteSessionStore(session_timeout, on_expire, path=db_path),
+            SqliteRecentContacts(contacts_capacity, path=db_path),
+            SqliteMessageDeduplicator(path=db_path)
+        )
+    if backend != 'memory':
+        raise ValueError(f"Unknown state backend: {backend}")
+    return (
+        SessionStore(session_timeout, on_expire),
+        RecentContacts(contacts_capacity, snapshot_path=snapshot_path),
+        MessageDeduplicator()
+    )
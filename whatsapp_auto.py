@@ -1,26 +1,110 @@
+import argparse
+import json
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 from dotenv import load_dotenv
+from whatsapp_web_client import DEFAULT_DAEMON_URL
+
+WHATSAPP_WEB_URL = 'https://web.whatsapp.com/'
+# Chrome profile of the first browser; further browsers use numbered copies
+PROFILE_DIR = os.path.join(os.path.expanduser('~'), 'whatsapp_auto')
+# Remembers the chromedriver that ChromeDriverManager resolved, so later runs
+# start without a network round trip
+DRIVER_PATH_CACHE = os.path.join(os.path.expanduser('~'), '.bino', 'chromedriver_path')
+# WhatsApp allows at most four linked devices per account
+MAX_DRIVERS = 4
+MAX_CONTACTS = 10
+
+# Seconds to wait for a chat to open, and for a sent message to be accepted
+CHAT_TIMEOUT = 20
+DELIVERY_TIMEOUT = 15
+# How often explicit waits re-check the page
+POLL_INTERVAL = 0.1
+# Seconds between daemon checks that every browser is alive and logged in
+KEEPALIVE_INTERVAL = 30
+# Seconds between login checks while a browser reloads WhatsApp Web
+KEEPALIVE_CHECK_INTERVAL = 1.0
+
+SEARCH_BOX_XPATH = '//div[@title="Search or start new chat"]'
+MESSAGE_BOX_XPATH = '//div[@title="Type a message"]'
+SEND_BUTTON_XPATH = '//button[@data-testid="compose-btn-send"]'
+OUTGOING_MESSAGE_XPATH = '//div[contains(@class, "message-out")]'
+# Single tick (accepted by the server) or double tick (delivered) on an outgoing message
+SENT_TICK_XPATH = './/span[@data-icon="msg-check" or @data-icon="msg-dblcheck"]'
+
+_driver_path: Optional[str] = None
+_driver_path_lock = threading.Lock()
+
+def resolve_driver_path() -> str:
+    """
+    Find chromedriver: CHROMEDRIVER_PATH, then the cached path from an earlier
+    run, then ChromeDriverManager (which checks for updates over the network).
+
+    Returns:
+        str: Path to the chromedriver executable
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path and os.path.exists(_driver_path):
+            return _driver_path
+        path = os.getenv('CHROMEDRIVER_PATH')
+        if not path:
+            try:
+                with open(DRIVER_PATH_CACHE, 'r') as f:
+                    path = f.read().strip()
+            except OSError:
+                path = None
+        if not path or not os.path.exists(path):
+            path = ChromeDriverManager().install()
+            try:
+                os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+                with open(DRIVER_PATH_CACHE, 'w') as f:
+                    f.write(path)
+            except OSError as e:
+                print(f"Could not cache chromedriver path: {e}")
+        _driver_path = path
+        return path
 
 class WhatsAppAutomation:
-    def __init__(self):
+    def __init__(self, num_drivers: Optional[int] = None):
+        """
+        Args:
+            num_drivers: Browsers to send from in parallel (WHATSAPP_AUTO_DRIVERS,
+                default 1). Each one uses its own Chrome profile, linked to the
+                account as a separate WhatsApp Web device
+        """
         load_dotenv()
         self.trusted_contacts = self._load_trusted_contacts()
-        self.driver = self._setup_driver()
+        num_drivers = num_drivers or int(os.getenv('WHATSAPP_AUTO_DRIVERS', 1))
+        num_drivers = max(1, min(MAX_DRIVERS, num_drivers))
+        # Chrome start-up dominates, so launch the browsers concurrently
+        with ThreadPoolExecutor(max_workers=num_drivers) as pool:
+            self.drivers = list(pool.map(self._setup_driver, range(num_drivers)))
+        self.driver = self.drivers[0]
+        # Browsers are not thread-safe; one send (over all of them) at a time
+        self._send_lock = threading.Lock()
         
     def _load_trusted_contacts(self):
         """Load trusted contacts from environment variable"""
         contacts = os.getenv('TRUSTED_CONTACTS', '').split(',')
         return [c.strip() for c in contacts if c.strip()]
     
-    def _setup_driver(self):
+    def _setup_driver(self, index: int = 0):
         """Setup Chrome WebDriver with options"""
         chrome_options = Options()
         # Uncomment the line below to run in headless mode (no browser window)
@@ -29,76 +113,323 @@ class WhatsAppAutomation:
         chrome_options.add_argument('--disable-dev-shm-usage')
         chrome_options.add_argument('--disable-notifications')
         
-        # Set user data directory to maintain session
-        user_data_dir = os.path.join(os.path.expanduser('~'), 'whatsapp_auto')
+        # Set user data directory to maintain session; Chrome locks a profile
+        # to one browser, so every parallel browser needs its own
+        user_data_dir = PROFILE_DIR if index == 0 else f"{PROFILE_DIR}-{index}"
         chrome_options.add_argument(f'user-data-dir={user_data_dir}')
         
         # Initialize Chrome WebDriver
-        service = Service(ChromeDriverManager().install())
+        service = Service(resolve_driver_path())
         driver = webdriver.Chrome(service=service, options=chrome_options)
         driver.maximize_window()
         return driver
     
     def login_whatsapp(self):
-        """Open WhatsApp Web and wait for manual login"""
+        """Open WhatsApp Web in every browser and wait for manual login"""
         print("Opening WhatsApp Web...")
-        self.driver.get('https://web.whatsapp.com/')
+        for driver in self.drivers:
+            driver.get(WHATSAPP_WEB_URL)
         
-        # Wait for user to scan QR code
-        print("Please scan the QR code with your phone...")
-        WebDriverWait(self.driver, 60).until(
-            EC.presence_of_element_located((By.XPATH, '//div[@title="Search or start new chat"]'))
-        )
+        # Wait for user to scan QR code (once per browser profile)
+        print("Please scan the QR code with your phone..." if len(self.drivers) == 1 else
+              f"Please scan the QR code in each of the {len(self.drivers)} browser windows...")
+        for driver in self.drivers:
+            WebDriverWait(driver, 60).until(
+                EC.presence_of_element_located((By.XPATH, SEARCH_BOX_XPATH))
+            )
         print("Successfully logged in to WhatsApp Web!")
     
-    def send_emergency_message(self, message):
-        """Send emergency message to all trusted contacts"""
-        if not self.trusted_contacts:
+    def is_logged_in(self, driver=None) -> bool:
+        """Check that a browser shows the WhatsApp Web app rather than the QR code."""
+        driver = driver or self.driver
+        return bool(driver.find_elements(By.XPATH, SEARCH_BOX_XPATH) or
+                    driver.find_elements(By.XPATH, MESSAGE_BOX_XPATH))
+    
+    def keep_warm(self) -> bool:
+        """
+        Restart crashed browsers and reopen WhatsApp Web where it was navigated away.
+        
+        The send lock is only held for one browser's navigation, restart or
+        login check at a time, never while waiting for the app to load, so
+        alerts are not held up by a browser that is logged out.
+        
+        Returns:
+            bool: True if every browser is logged in
+        """
+        ready = True
+        for index in range(len(self.drivers)):
+            with self._send_lock:
+                driver = self.drivers[index]
+                try:
+                    if not driver.current_url.startswith(WHATSAPP_WEB_URL):
+                        driver.get(WHATSAPP_WEB_URL)
+                except WebDriverException:
+                    print(f"Browser {index + 1} stopped responding, restarting it...")
+                    try:
+                        driver.quit()
+                    except WebDriverException:
+                        pass
+                    driver = self.drivers[index] = self._setup_driver(index)
+                    driver.get(WHATSAPP_WEB_URL)
+                    if index == 0:
+                        self.driver = driver
+            # The app can take a few seconds to reload after a restart; poll
+            # with the lock taken only for each quick check
+            deadline = time.monotonic() + CHAT_TIMEOUT
+            while True:
+                with self._send_lock:
+                    logged_in = self._quick_login_check(driver)
+                if logged_in or time.monotonic() >= deadline:
+                    break
+                time.sleep(KEEPALIVE_CHECK_INTERVAL)
+            if not logged_in:
+                print(f"Browser {index + 1} is not logged in to WhatsApp Web. Please scan the QR code.")
+                ready = False
+        return ready
+    
+    def send_emergency_message(self, message: str, contacts: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """
+        Send emergency message to all trusted contacts.
+        
+        Contacts are shared out over the browsers, which send concurrently; each
+        browser moves on as soon as its message shows a sent tick.
+        
+        Args:
+            message: Text to send
+            contacts: Recipients; defaults to TRUSTED_CONTACTS
+        
+        Returns:
+            Dict[str, bool]: Per-contact result
+        """
+        contacts = list(contacts) if contacts is not None else self.trusted_contacts
+        if not contacts:
             print("No trusted contacts found. Please set TRUSTED_CONTACTS in .env")
-            return
-            
-        for contact in self.trusted_contacts[:10]:  # Limit to first 10 contacts
-            try:
-                self._send_message(contact, message)
-                print(f"Message sent to {contact}")
-                time.sleep(2)  # Small delay between messages
-            except Exception as e:
-                print(f"Failed to send message to {contact}: {str(e)}")
+            return {}
+        
+        with self._send_lock:
+            return self._send_parallel(message, contacts[:MAX_CONTACTS])  # Limit to first 10 contacts
     
-    def _send_message(self, phone_number, message):
-        """Send a message to a specific contact"""
+    def _send_parallel(self, message: str, contacts) -> Dict[str, bool]:
+        pending = queue.Queue()
+        for contact in contacts:
+            pending.put(contact)
+        results = {}
+        results_lock = threading.Lock()
+        
+        def worker(driver):
+            while True:
+                try:
+                    contact = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    ok = self._send_message(contact, message, driver)
+                except WebDriverException as e:
+                    print(f"Failed to send message to {contact}: {e.msg}")
+                    ok = False
+                if ok:
+                    print(f"Message sent to {contact}")
+                with results_lock:
+                    results[contact] = ok
+        
+        start = time.perf_counter()
+        # A logged-out browser would only time out on its share of the contacts
+        drivers = [driver for driver in self.drivers if self._quick_login_check(driver)] or self.drivers
+        threads = [threading.Thread(target=worker, args=(driver,), daemon=True) for driver in drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Sent {sum(results.values())}/{len(results)} messages in {time.perf_counter() - start:.1f}s "
+              f"using {len(drivers)} browser(s)")
+        return results
+    
+    def _quick_login_check(self, driver) -> bool:
+        try:
+            return self.is_logged_in(driver)
+        except WebDriverException:
+            return False
+    
+    def _send_message(self, phone_number: str, message: str, driver=None) -> bool:
+        """
+        Send a message to a specific contact and wait until WhatsApp accepts it.
+        
+        Returns:
+            bool: True once the message shows a sent or delivered tick
+        """
+        driver = driver or self.driver
         # Open chat with the contact
-        chat_url = f'https://web.whatsapp.com/send?phone={phone_number}'
-        self.driver.get(chat_url)
+        chat_url = f'{WHATSAPP_WEB_URL}send?phone={phone_number}'
+        driver.get(chat_url)
         
         # Wait for chat to load
         try:
-            WebDriverWait(self.driver, 20).until(
-                EC.presence_of_element_located((By.XPATH, '//div[@title="Type a message"]'))
+            input_box = WebDriverWait(driver, CHAT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                EC.element_to_be_clickable((By.XPATH, MESSAGE_BOX_XPATH))
             )
-        except:
+        except TimeoutException:
             print(f"Could not open chat with {phone_number}. The contact may not exist or you may not have messaged them before.")
-            return
+            return False
         
-        # Type and send message
-        input_box = self.driver.find_element(By.XPATH, '//div[@title="Type a message"]')
+        # Remember how many of our messages are already in the chat, so the
+        # tick we wait for is on the new one
+        sent_before = len(driver.find_elements(By.XPATH, OUTGOING_MESSAGE_XPATH))
+        
+        # Type the message; Enter would send each line separately, so lines
+        # are joined with Shift+Enter
         input_box.click()
-        input_box.send_keys(message)
+        for i, line in enumerate(message.split('\n')):
+            if i:
+                input_box.send_keys(Keys.SHIFT, Keys.ENTER)
+            input_box.send_keys(line)
         
         # Click send button
-        send_button = self.driver.find_element(By.XPATH, '//button[@data-testid="compose-btn-send"]')
-        send_button.click()
+        driver.find_element(By.XPATH, SEND_BUTTON_XPATH).click()
         
-        # Wait a moment for the message to be sent
-        time.sleep(2)
+        # Wait for the sent tick instead of a fixed delay
+        try:
+            WebDriverWait(driver, DELIVERY_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                lambda d: self._last_message_sent(d, sent_before)
+            )
+        except TimeoutException:
+            print(f"Message to {phone_number} was not confirmed within {DELIVERY_TIMEOUT}s")
+            return False
+        return True
+    
+    @staticmethod
+    def _last_message_sent(driver, sent_before: int) -> bool:
+        outgoing = driver.find_elements(By.XPATH, OUTGOING_MESSAGE_XPATH)
+        return len(outgoing) > sent_before and bool(outgoing[-1].find_elements(By.XPATH, SENT_TICK_XPATH))
     
     def close(self):
-        """Close the browser"""
-        self.driver.quit()
+        """Close the browsers"""
+        for driver in self.drivers:
+            driver.quit()
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so clients skip the TCP handshake
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._reply(404, {'error': 'not found'})
+        self._reply(200, {'ready': self.server.whatsapp_daemon.ready,
+                          'drivers': len(self.server.whatsapp_daemon.automation.drivers)})
+
+    def do_POST(self):
+        if self.path != '/send':
+            return self._reply(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            message = body['message']
+            contacts = body.get('contacts')
+            if not isinstance(message, str) or (contacts is not None and not isinstance(contacts, list)):
+                raise ValueError('message must be a string and contacts a list')
+        except (KeyError, ValueError) as e:
+            return self._reply(400, {'error': f"invalid request: {e}"})
+        results = self.server.whatsapp_daemon.automation.send_emergency_message(message, contacts)
+        self._reply(200, {'results': results})
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Requests are reported by the send itself
+
+class WhatsAppWebDaemon:
+    """
+    Keeps logged-in WhatsApp Web browsers open and sends messages on request.
+    
+    Starting Chrome and loading WhatsApp Web takes far too long to do per alert,
+    so the daemon does it once and then serves a small JSON API on a loopback
+    HTTP port (see whatsapp_web_client.WhatsAppWebClient):
+    
+        GET /health  -> {"ready": bool, "drivers": int}
+        POST /send   {"message": str, "contacts": [str, ...]} -> {"results": {number: bool}}
+    
+    A keepalive thread restarts crashed browsers and reports lost logins.
+    """
+    
+    def __init__(self, automation: WhatsAppAutomation, url: str = DEFAULT_DAEMON_URL,
+                 keepalive_interval: float = KEEPALIVE_INTERVAL):
+        """
+        Args:
+            automation: Browsers to send from, already logged in
+            url: Address to listen on; only bind to a loopback address, as
+                requests are not authenticated
+            keepalive_interval: Seconds between browser health checks
+        """
+        self.automation = automation
+        parsed = urlparse(url)
+        self.server = ThreadingHTTPServer((parsed.hostname or '127.0.0.1', parsed.port or 5057),
+                                          _DaemonRequestHandler)
+        self.server.daemon_threads = True
+        self.server.whatsapp_daemon = self
+        self.keepalive_interval = keepalive_interval
+        self.ready = True
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Start the keepalive thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._keepalive, name='whatsapp-keepalive', daemon=True)
+        self._thread.start()
+    
+    def serve_forever(self):
+        """Serve send requests until interrupted."""
+        self.start()
+        host, port = self.server.server_address[:2]
+        print(f"WhatsApp Web daemon listening on http://{host}:{port}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stop()
+    
+    def stop(self):
+        self._stop_event.set()
+        self.server.server_close()
+    
+    def _keepalive(self):
+        while not self._stop_event.wait(self.keepalive_interval):
+            try:
+                self.ready = self.automation.keep_warm()
+            except Exception as e:
+                print(f"WhatsApp Web keepalive failed: {e}")
+                self.ready = False
 
 def main():
+    parser = argparse.ArgumentParser(description='Send emergency messages through WhatsApp Web')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Stay running and send messages requested over HTTP')
+    parser.add_argument('--url', default=None,
+                        help=f"Daemon listen address (default: WHATSAPP_DAEMON_URL or {DEFAULT_DAEMON_URL})")
+    parser.add_argument('--drivers', type=int, default=None,
+                        help='Browsers to send from in parallel (default: WHATSAPP_AUTO_DRIVERS or 1)')
+    args = parser.parse_args()
+    
+    whatsapp = WhatsAppAutomation(args.drivers)
+    
+    if args.daemon:
+        try:
+            whatsapp.login_whatsapp()
+            url = args.url or os.getenv('WHATSAPP_DAEMON_URL') or DEFAULT_DAEMON_URL
+            WhatsAppWebDaemon(whatsapp, url).serve_forever()
+        except KeyboardInterrupt:
+            print("Stopping WhatsApp Web daemon...")
+        finally:
+            whatsapp.close()
+        return
+    
     # Example usage
-    whatsapp = WhatsAppAutomation()
     
     try:
         # Login (only needed once per session)
@@ -117,8 +448,9 @@ def main():
         
         # Send emergency messages
         print("Sending emergency messages...")
-        whatsapp.send_emergency_message(emergency_message)
-        print("Emergency messages sent successfully!")
+        results = whatsapp.send_emergency_message(emergency_message)
+        if results and all(results.values()):
+            print("Emergency messages sent successfully!")
         
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -1,27 +1,323 @@
-import json
+import heapq
+import itertools
 import logging
-import os
+import random
+import threading
+import time
+from concurrent.futures import Future, wait
 from datetime import datetime
-from typing import Dict, Optional
-import requests
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from config_store import ConfigSnapshot, ConfigStore, get_store, normalize_phone
+from outbox import OUTBOX_MAX_AGE, OUTBOX_PATH, Outbox
+
+# Upper bound on concurrent Graph API requests during a fan-out
+DEFAULT_MAX_WORKERS = 10
+# Overall time budget for a fan-out before pending sends are reported as failed
+DEFAULT_BULK_TIMEOUT = 15.0
+
+# (connect, read) timeouts for Graph API requests, in seconds
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+# Retries for transient failures, with full-jitter exponential backoff
+DEFAULT_MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Slack added to the worst-case send time for an outbox lease, in seconds
+OUTBOX_LEASE_MARGIN = 10.0
+
+# Outbound message priorities (lower is sent first)
+PRIORITY_EMERGENCY = 0
+PRIORITY_CONFIRMATION = 1
+PRIORITY_NOTICE = 2
+
+# Sustained messages per second and burst size allowed per sender phone number ID
+DEFAULT_RATE_LIMIT = 20.0
+DEFAULT_RATE_BURST = 20
+
+class TokenBucket:
+    """Token bucket rate limiter. Not thread-safe; callers hold their own lock."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, force: bool = False) -> float:
+        """
+        Take one token.
+        
+        Args:
+            force: Take the token even if the bucket is empty, going into debt
+                that later traffic pays back
+            
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        self._refill()
+        if self.tokens >= 1 or force:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class OutboundScheduler:
+    """
+    Priority send queue shaped by a token bucket per sender phone number ID.
+    
+    Worker threads always take the highest-priority message first. Emergency
+    messages are never held back by the rate limit (they borrow tokens), while
+    lower-priority messages wait until their sender's bucket has capacity.
+    """
+
+    def __init__(self, send_func: Callable[[str, str], bool], rate: float = DEFAULT_RATE_LIMIT,
+                 burst: float = DEFAULT_RATE_BURST, num_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        Args:
+            send_func: Function that sends one message, called as send_func(to_number, message)
+            rate: Sustained messages per second per phone number ID
+            burst: Bucket capacity per phone number ID
+            num_workers: Number of concurrent senders
+        """
+        self.send_func = send_func
+        self.rate = rate
+        self.burst = burst
+        # (priority, sequence, queued_at, phone_number_id, to_number, message, future, before_send)
+        self._heap: List[Tuple[int, int, float, str, str, str, Future, Optional[Callable[[], bool]]]] = []
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        self._sent = {PRIORITY_EMERGENCY: 0, PRIORITY_CONFIRMATION: 0, PRIORITY_NOTICE: 0}
+        self._throttled = 0
+        self._workers = [
+            threading.Thread(target=self._run, name=f"whatsapp-send-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, phone_number_id: str, to_number: str, message: str,
+               priority: int = PRIORITY_NOTICE, before_send: Optional[Callable[[], bool]] = None) -> Future:
+        """
+        Queue a message.
+        
+        Args:
+            before_send: Called by the worker just before sending; if it returns
+                False the send is skipped and the future cancelled
+        
+        Returns:
+            Future: Resolves to True if the message was sent, False otherwise.
+            Cancelling it before a worker picks it up skips the send.
+        """
+        future = Future()
+        with self._cond:
+            heapq.heappush(self._heap, (priority, next(self._counter), time.monotonic(),
+                                        phone_number_id, to_number, message, future, before_send))
+            self._cond.notify()
+        return future
+
+    def stop(self):
+        """Stop the workers; messages still queued are cancelled."""
+        with self._cond:
+            self._running = False
+            pending, self._heap = self._heap, []
+            self._cond.notify_all()
+        for item in pending:
+            item[-1].cancel()
+
+    def stats(self) -> Dict[str, object]:
+        """Return queue depth, per-priority send counts and throttling events."""
+        with self._cond:
+            return {
+                'depth': len(self._heap),
+                'sent_by_priority': dict(self._sent),
+                'throttled': self._throttled
+            }
+
+    def _bucket(self, phone_number_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_number_id)
+        if bucket is None:
+            bucket = self._buckets[phone_number_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running:
+                        return
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    priority, _, queued_at, phone_number_id, to_number, message, future, before_send = self._heap[0]
+                    delay = self._bucket(phone_number_id).take(force=priority == PRIORITY_EMERGENCY)
+                    if delay == 0:
+                        heapq.heappop(self._heap)
+                        break
+                    # Wait for a token, or for a more urgent message to arrive
+                    self._throttled += 1
+                    self._cond.wait(delay)
+
+            if before_send is not None and not future.cancelled():
+                try:
+                    proceed = before_send()
+                except Exception as e:
+                    logging.error(f"Pre-send check for {to_number} failed: {e}")
+                    proceed = True
+                if not proceed:
+                    future.cancel()
+            if not future.set_running_or_notify_cancel():
+                continue
+            metrics.observe(metrics.STAGE_METRIC, time.monotonic() - queued_at,
+                            stage='send_queue_wait', priority=priority)
+            try:
+                result = bool(self.send_func(to_number, message))
+                future.set_result(result)
+            except Exception as e:
+                logging.error(f"Error sending WhatsApp message to {to_number}: {e}")
+                future.set_result(False)
+            with self._cond:
+                self._sent[priority] = self._sent.get(priority, 0) + 1
 
 class WhatsAppSender:
-    def __init__(self, config_path: str = 'config.json'):
-        self.config = self._load_config(config_path)
-        self.base_url = "https://graph.facebook.com/v19.0/"
-        self.headers = {
-            'Authorization': f"Bearer {self.config.get('whatsapp_token', '')}",
-            'Content-Type': 'application/json'
-        }
+    def __init__(self, config_path: str = 'config.json', max_workers: int = DEFAULT_MAX_WORKERS,
+                 config_store: Optional[ConfigStore] = None):
+        """
+        Args:
+            config_path: Config file, used when no config_store is given
+            max_workers: Concurrent sends on the scheduler's worker pool
+            config_store: Shared configuration; credentials, contacts and the
+                Graph API URL are read from its current snapshot on every send,
+                so config changes apply without a restart
+        """
+        self.config_store = config_store or get_store(config_path)
+        self.max_workers = max_workers
+        self.timeout = (
+            float(self.config.get('http_connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+            float(self.config.get('http_read_timeout', DEFAULT_READ_TIMEOUT))
+        )
+        self.max_retries = int(self.config.get('http_max_retries', DEFAULT_MAX_RETRIES))
+        # The HTTP client (and the requests import) is created on first use so
+        # constructing the sender stays cheap at startup
+        self._client = None
+        self._transient_errors = ()
+        self._client_lock = threading.Lock()
+        # All queued and bulk sends go through the priority scheduler
+        self.scheduler = OutboundScheduler(
+            self.send_message,
+            rate=float(self.config.get('whatsapp_rate_limit', DEFAULT_RATE_LIMIT)),
+            burst=float(self.config.get('whatsapp_rate_burst', DEFAULT_RATE_BURST)),
+            num_workers=max_workers
+        )
+        # Alerts are written to a durable outbox before sending and retried from
+        # there after failures or a restart; set outbox_path to "" to disable
+        self.outbox = None
+        outbox_path = self.config.get('outbox_path', OUTBOX_PATH)
+        if outbox_path:
+            try:
+                # The lease covers a send_message() that exhausts every retry, so
+                # the worker never re-sends an alert that is still in flight
+                self.outbox = Outbox(self.send_message, outbox_path,
+                                     lease=self.max_send_time() + OUTBOX_LEASE_MARGIN,
+                                     max_age=float(self.config.get('outbox_max_age', OUTBOX_MAX_AGE)))
+                self.outbox.start()
+            except Exception as e:
+                logging.error(f"Could not open alert outbox {outbox_path}: {e}")
+
+    @property
+    def config(self) -> ConfigSnapshot:
+        """The current configuration snapshot."""
+        return self.config_store.snapshot
 
-    def _load_config(self, config_path: str) -> dict:
-        """Load configuration from JSON file."""
+    def _create_client(self):
+        """
+        Create the persistent HTTP client used for all Graph API requests.
+        
+        Uses an HTTP/2 ``httpx`` client when ``whatsapp_http2`` is enabled in the
+        config and httpx is installed, otherwise a pooled keep-alive ``requests``
+        session.
+        
+        Returns:
+            tuple: The client and the exception types that are safe to retry
+        """
+        if self.config.get('whatsapp_http2'):
+            try:
+                import httpx
+                client = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                    limits=httpx.Limits(max_connections=self.max_workers,
+                                        max_keepalive_connections=self.max_workers)
+                )
+                logging.info("Using HTTP/2 client for the WhatsApp API")
+                return client, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+            except ImportError:
+                logging.warning("HTTP/2 requested but httpx[http2] is not installed; "
+                                "falling back to HTTP/1.1 keep-alive")
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # Retries are handled in send_message so they can be jittered and logged
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session, (requests.exceptions.ConnectionError,)
+
+    def _get_client(self):
+        """Return the shared HTTP client, creating it on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    client, self._transient_errors = self._create_client()
+                    self._client = client
+        return self._client
+
+    def warm_up(self) -> bool:
+        """
+        Pre-connect to the Graph API so the first alert skips DNS/TCP/TLS setup.
+        
+        Returns:
+            bool: True if a connection was established, False otherwise
+        """
+        start = time.monotonic()
         try:
-            with open(config_path, 'r') as f:
-                return json.load(f)
+            self._get_client().get(self.config.graph_base_url, timeout=self.timeout)
+            logging.info(f"WhatsApp API connection warmed up in {time.monotonic() - start:.2f}s")
+            return True
         except Exception as e:
-            logging.error(f"Error loading config: {e}")
-            return {}
+            logging.warning(f"Could not warm up WhatsApp API connection: {e}")
+            return False
+
+    def close(self):
+        """Close pooled connections and stop the send workers."""
+        self.scheduler.stop()
+        if self.outbox is not None:
+            self.outbox.stop()
+        if self._client is not None:
+            self._client.close()
+
+    def max_send_time(self) -> float:
+        """Longest send_message() can take: every attempt timing out, plus the longest backoffs."""
+        return (self.max_retries + 1) * sum(self.timeout) + self.max_retries * BACKOFF_MAX
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
 
     def send_message(self, to_number: str, message: str) -> bool:
         """
@@ -34,17 +330,26 @@ class WhatsAppSender:
         Returns:
             bool: True if message was sent successfully, False otherwise
         """
-        phone_number_id = self.config.get("whatsapp_phone_number_id")
-        if not phone_number_id:
+        with metrics.timed('graph_send'):
+            ok = self._send_message(to_number, message)
+        metrics.inc('bino_messages_total', transport='graph', result='sent' if ok else 'failed')
+        return ok
+
+    def _send_message(self, to_number: str, message: str) -> bool:
+        """Send one message, retrying transient failures."""
+        # One snapshot per send, so a reload mid-send cannot mix URL and token
+        config = self.config
+        url = config.graph_messages_url
+        if not url:
             logging.error("WhatsApp phone number ID not configured.")
             return False
 
-        # Format the phone number correctly (remove any non-digit characters except +)
-        to_number = ''.join(c for c in to_number if c.isdigit() or c == '+')
-        if not to_number.startswith('+'):
-            to_number = f"+{to_number}"
-
-        url = f"{self.base_url}{phone_number_id}/messages"
+        # Format the phone number correctly (E.164: + followed by digits)
+        formatted = normalize_phone(to_number)
+        if formatted is None:
+            logging.error(f"Invalid WhatsApp recipient number: {to_number}")
+            return False
+        to_number = formatted
         
         payload = {
             "messaging_product": "whatsapp",
@@ -54,52 +359,193 @@ class WhatsAppSender:
             "text": {"body": message}
         }
 
-        try:
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self._get_client().post(
+                    url,
+                    headers=config.graph_headers,
+                    json=payload,
+                    timeout=self.timeout
+                )
+            except self._transient_errors as e:
+                metrics.inc('bino_graph_responses_total', status='connection_error')
+                error_msg = f"Error sending WhatsApp message: {str(e)}"
+            except Exception as e:
+                metrics.inc('bino_graph_responses_total', status='error')
+                # Timeouts after the request went out are not retried, the
+                # message may already have been delivered
+                logging.error(f"Error sending WhatsApp message: {str(e)}")
+                return False
+            else:
+                metrics.inc('bino_graph_responses_total', status=response.status_code)
+                if response.status_code < 400:
+                    logging.info(f"Message sent successfully to {to_number}")
+                    return True
+                error_msg = f"Error sending WhatsApp message: HTTP {response.status_code} - {response.text}"
+                if response.status_code not in RETRY_STATUS_CODES:
+                    logging.error(error_msg)
+                    return False
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, retry_after)
+                logging.warning(f"{error_msg}; retrying in {delay:.2f}s "
+                                f"(attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+        logging.error(error_msg)
+        return False
+
+    def enqueue_message(self, to_number: str, message: str, priority: int = PRIORITY_NOTICE,
+                        before_send: Optional[Callable[[], bool]] = None) -> Future:
+        """
+        Queue a message on the priority scheduler instead of sending it inline.
+        
+        Args:
+            to_number: Recipient's phone number with country code
+            message: The message to send
+            priority: PRIORITY_EMERGENCY, PRIORITY_CONFIRMATION or PRIORITY_NOTICE
+            before_send: Called just before the send starts; returning False skips it
+            
+        Returns:
+            Future: Resolves to True if the message was sent, False otherwise
+        """
+        phone_number_id = self.config.get("whatsapp_phone_number_id", '')
+        return self.scheduler.submit(phone_number_id, to_number, message, priority, before_send)
+
+    def dispatch(self, recipients: Iterable[str], message: str,
+                 priority: int = PRIORITY_EMERGENCY, durable: bool = False) -> Dict[str, Future]:
+        """
+        Queue the same message for several recipients without waiting for the sends.
+        
+        Args:
+            recipients: Phone numbers with country code
+            message: The message to send
+            priority: Scheduler priority of the sends
+            durable: Record the messages in the outbox first, so failed or
+                unfinished sends are retried in the background
+            
+        Returns:
+            Dict[str, Future]: Per-recipient future resolving to True if the
+            message was sent; cancelling it before it starts skips the send
+        """
+        # Preserve order and drop duplicates so nobody gets the alert twice
+        unique_recipients = list(dict.fromkeys(r for r in recipients if r))
+        if not unique_recipients:
+            return {}
+
+        outbox_ids = [None] * len(unique_recipients)
+        if durable and self.outbox is not None:
+            try:
+                outbox_ids = self.outbox.add(unique_recipients, message)
+            except Exception as e:
+                # Never hold up the alert itself because the outbox is unavailable
+                logging.error(f"Could not record alert in outbox: {e}")
+
+        futures = {}
+        for recipient, outbox_id in zip(unique_recipients, outbox_ids):
+            if outbox_id is None:
+                futures[recipient] = self.enqueue_message(recipient, message, priority)
+                continue
+            # The lease taken in add() only has to cover the queue wait; it is
+            # renewed for the full send when the send starts, and the send is
+            # skipped if the outbox worker already took the message over
+            future = self.enqueue_message(recipient, message, priority,
+                                          before_send=lambda outbox_id=outbox_id: self.outbox.renew(outbox_id))
+            # A cancelled send is left to the outbox: it was delivered elsewhere
+            # (mark_sent), taken over, or is retried once its lease expires
+            future.add_done_callback(
+                lambda f, outbox_id=outbox_id: f.cancelled() or self.outbox.complete(outbox_id, bool(f.result()))
             )
-            response.raise_for_status()
-            logging.info(f"Message sent successfully to {to_number}")
-            return True
+            futures[recipient] = future
+        return futures
+
+    def send_bulk(self, recipients: Iterable[str], message: str,
+                  timeout: float = DEFAULT_BULK_TIMEOUT,
+                  priority: int = PRIORITY_EMERGENCY, durable: bool = False) -> Dict[str, bool]:
+        """
+        Send the same message to several recipients concurrently.
+        
+        Sends are dispatched on the scheduler's worker pool, so the whole fan-out
+        takes roughly one Graph API round-trip instead of one per recipient.
+        
+        Args:
+            recipients: Phone numbers with country code
+            message: The message to send
+            timeout: Overall deadline in seconds for the whole fan-out
+            priority: Scheduler priority of the sends
+            durable: Record the messages in the outbox first, so failed or
+                unfinished sends are retried in the background
             
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Error sending WhatsApp message: {str(e)}"
-            if hasattr(e, 'response') and e.response is not None:
-                error_msg += f" - {e.response.text}"
-            logging.error(error_msg)
-            return False
+        Returns:
+            Dict[str, bool]: Per-recipient result; recipients whose send did not
+            finish before the deadline are reported as False
+        """
+        start = time.monotonic()
+        futures = {future: recipient for recipient, future in
+                   self.dispatch(recipients, message, priority, durable).items()}
+        if not futures:
+            return {}
+        unique_recipients = list(futures.values())
+        done, not_done = wait(futures, timeout=timeout)
+
+        results = {}
+        for future, recipient in futures.items():
+            if future in done:
+                try:
+                    results[recipient] = bool(future.result())
+                except Exception as e:
+                    logging.error(f"Error sending WhatsApp message to {recipient}: {e}")
+                    results[recipient] = False
+            else:
+                future.cancel()
+                results[recipient] = False
+
+        if not_done:
+            logging.warning(f"Fan-out deadline of {timeout}s reached; {len(not_done)} "
+                            f"of {len(unique_recipients)} sends did not complete")
+        elapsed = time.monotonic() - start
+        metrics.observe(metrics.STAGE_METRIC, elapsed, stage='fanout')
+        logging.info(f"Fan-out to {len(unique_recipients)} recipients finished in "
+                     f"{elapsed:.2f}s "
+                     f"({sum(results.values())} succeeded)")
+        return results
 
     def send_emergency_alert(self, location_info: Dict[str, str]) -> bool:
         """
-        Send an emergency alert via WhatsApp.
+        Send an emergency alert via WhatsApp to every trusted contact.
         
         Args:
             location_info: Dictionary containing 'address' and 'maps_link'
             
         Returns:
-            bool: True if message was sent successfully, False otherwise
+            bool: True if the alert reached at least one contact, False otherwise
         """
-        trusted_contact = self.config.get('trusted_contact')
-        if not trusted_contact:
+        config = self.config
+        if not config.contacts:
             logging.error("No trusted contact configured.")
             return False
 
         try:
-            message = (
-                f"🚨 *EMERGENCY ALERT* 🚨\n\n"
-                f"*{self.config.get('user_name', 'User')}* needs help!\n\n"
-                f"📍 *Location:* {location_info.get('address', 'Unknown location')}\n"
-                f"🗺️ *Map Link:* {location_info.get('maps_link', 'No location available')}\n\n"
-                f"⏰ *Time:* {self._get_current_timestamp()}"
-            )
-            
-            return self.send_message(trusted_contact, message)
+            message = self.format_emergency_alert(location_info, config)
+            return any(self.send_bulk(config.contacts, message, durable=True).values())
         except Exception as e:
             logging.error(f"Error in send_emergency_alert: {e}")
             return False
 
+    def format_emergency_alert(self, location_info: Dict[str, str],
+                               config: Optional[ConfigSnapshot] = None) -> str:
+        """Build the emergency alert text for a location."""
+        config = config or self.config
+        return (
+            f"🚨 *EMERGENCY ALERT* 🚨\n\n"
+            f"*{config.user_name or 'User'}* needs help!\n\n"
+            f"📍 *Location:* {location_info.get('address', 'Unknown location')}\n"
+            f"🗺️ *Map Link:* {location_info.get('maps_link', 'No location available')}\n\n"
+            f"⏰ *Time:* {self._get_current_timestamp()}"
+        )
+
     def _get_current_timestamp(self) -> str:
         """Get current timestamp in a readable format."""
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
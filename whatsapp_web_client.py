@@ -0,0 +1,109 @@
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+import metrics
+from config_store import ConfigStore
+
+# Where the WhatsApp Web daemon (python whatsapp_auto.py --daemon) listens
+DEFAULT_DAEMON_URL = 'http://127.0.0.1:5057'
+# A health check must not hold up an alert; anything slower counts as down
+HEALTH_TIMEOUT = 0.5
+# The daemon answers once every message shows a sent tick
+DEFAULT_SEND_TIMEOUT = 120.0
+
+class WhatsAppWebClient:
+    """
+    Client for the WhatsApp Web daemon, a second transport next to the Graph API.
+
+    The daemon keeps logged-in browsers open, so a send is handed to WhatsApp
+    Web immediately instead of waiting for Chrome to start and log in.
+    """
+
+    def __init__(self, url: Optional[str] = None, config_store: Optional[ConfigStore] = None,
+                 timeout: float = DEFAULT_SEND_TIMEOUT):
+        """
+        Args:
+            url: Daemon base URL; defaults to whatsapp_daemon_url in the config
+            config_store: Shared configuration, read on every call so the
+                daemon can be enabled or moved without a restart
+            timeout: Seconds to wait for the daemon to finish sending
+        """
+        self._url = url
+        self.config_store = config_store
+        self.timeout = timeout
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def url(self) -> Optional[str]:
+        """The daemon base URL, or None if no daemon is configured."""
+        url = self._url
+        if url is None and self.config_store is not None:
+            url = self.config_store.snapshot.get('whatsapp_daemon_url')
+        return url.rstrip('/') if url else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.url is not None
+
+    def _get_session(self):
+        """Return a keep-alive session, creating it on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+        return self._session
+
+    def available(self) -> bool:
+        """
+        Check that the daemon is running and its browsers are logged in.
+
+        Returns:
+            bool: True if the daemon reported itself ready
+        """
+        if not self.enabled:
+            return False
+        try:
+            response = self._get_session().get(f"{self.url}/health", timeout=HEALTH_TIMEOUT)
+            return response.ok and bool(response.json().get('ready'))
+        except Exception as e:
+            logging.debug(f"WhatsApp Web daemon not available: {e}")
+            return False
+
+    @metrics.timed('web_send')
+    def send(self, recipients: Iterable[str], message: str) -> Dict[str, bool]:
+        """
+        Send a message to several contacts through the daemon.
+
+        Args:
+            recipients: Phone numbers with country code
+            message: Text to send
+
+        Returns:
+            Dict[str, bool]: Per-recipient result; all False if the daemon
+            could not be reached
+        """
+        recipients = list(dict.fromkeys(recipients))
+        if not recipients or not self.enabled:
+            return {number: False for number in recipients}
+        try:
+            response = self._get_session().post(
+                f"{self.url}/send",
+                json={'message': message, 'contacts': recipients},
+                timeout=(HEALTH_TIMEOUT, self.timeout)
+            )
+            response.raise_for_status()
+            results = response.json().get('results', {})
+        except Exception as e:
+            logging.error(f"WhatsApp Web daemon send failed: {e}")
+            results = {}
+        results = {number: bool(results.get(number)) for number in recipients}
+        for ok in results.values():
+            metrics.inc('bino_messages_total', transport='whatsapp_web', result='sent' if ok else 'failed')
+        return results
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
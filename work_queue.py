@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+import metrics
+
+class WorkQueue:
+    """
+    Bounded in-process work queue served by a pool of worker threads.
+
+    Producers call submit() and return immediately; when the queue is full
+    the item is rejected instead of blocking, so callers can apply backpressure.
+    """
+
+    def __init__(self, handler: Callable[[Any], None], num_workers: int = 4,
+                 max_size: int = 1000, name: str = 'work'):
+        """
+        Args:
+            handler: Function called with each queued item
+            num_workers: Number of worker threads
+            max_size: Maximum number of items waiting in the queue
+            name: Prefix for worker thread names and log messages
+        """
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_size)
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+        self._high_water = 0
+        self._total_wait = 0.0
+
+    def start(self):
+        """Start the worker threads (no-op if already running)."""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, timeout: float = 5.0):
+        """Ask the workers to exit once the items already queued are processed."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join(timeout)
+
+    def submit(self, item: Any) -> bool:
+        """
+        Queue an item for processing without blocking.
+
+        Returns:
+            bool: True if the item was queued, False if the queue is full
+        """
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logging.warning(f"{self.name} queue full ({self.max_size} items); rejecting work")
+            return False
+
+        with self._lock:
+            self._enqueued += 1
+            self._high_water = max(self._high_water, self._queue.qsize())
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and throughput counters."""
+        with self._lock:
+            processed = self._processed + self._failed
+            return {
+                'depth': self._queue.qsize(),
+                'max_size': self.max_size,
+                'high_water': self._high_water,
+                'workers': len(self._workers),
+                'enqueued': self._enqueued,
+                'rejected': self._rejected,
+                'processed': self._processed,
+                'failed': self._failed,
+                'avg_wait_ms': round(self._total_wait / processed * 1000, 2) if processed else 0.0
+            }
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                self._queue.task_done()
+                return
+
+            queued_at, item = entry
+            waited = time.monotonic() - queued_at
+            metrics.observe(metrics.STAGE_METRIC, waited, stage='queue_wait', queue=self.name)
+            try:
+                self.handler(item)
+                ok = True
+            except Exception as e:
+                logging.error(f"Error processing {self.name} item: {e}", exc_info=True)
+                ok = False
+            finally:
+                self._queue.task_done()
+
+            with self._lock:
+                self._total_wait += waited
+                if ok:
+                    self._processed += 1
+                else:
+                    self._failed += 1